@@ -5,14 +5,41 @@ Works in restricted environments (offline mode)
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import psycopg2
+import psycopg2.extras
+import hashlib
 import json
+import logging
 import os
 import sys
-from typing import List, Dict
+from array import array
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Dict, Optional
+
+try:
+    import orjson  # optional: 2-5x faster JSON parsing and serialization
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    json_loads = orjson.loads
+
+    def json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+else:
+    json_loads = json.loads
+    json_dumps = json.dumps
 
 # Configuration
 EMBED_API_URL = os.environ.get('EMBED_API_URL', 'http://localhost:8082/api/embed')
+EMBED_BATCH_URL = os.environ.get('EMBED_BATCH_URL', EMBED_API_URL.replace('/api/embed', '/api/embed_batch'))
+EMBED_BATCH_SIZE = int(os.environ.get('EMBED_BATCH_SIZE', '32'))
+EMBED_MODEL = os.environ.get('EMBED_MODEL', 'all-MiniLM-L6-v2')  # part of the cache key
+EMBED_CACHE_DIR = Path(os.environ.get('EMBED_CACHE_DIR', Path(__file__).resolve().parent.parent / '.embed_cache'))
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')  # DEBUG shows every document
 DB_CONFIG = {
     'dbname': os.environ.get('DB_NAME', 'yugabyte'),
     'user': os.environ.get('DB_USER', 'yugabyte'),
@@ -21,41 +48,159 @@ DB_CONFIG = {
     'port': int(os.environ.get('DB_PORT', '5433'))
 }
 
+EMBED_TIMEOUT = 30  # seconds per text
+EMBED_WARMUP_TIMEOUT = int(os.environ.get('EMBED_WARMUP_TIMEOUT', '600'))  # one retry of the first request (model load)
+
+# Shared HTTP session: pools and keeps alive connections to the Phi-4 server.
+# Connection errors and 429/5xx are retried with exponential backoff (POST
+# included, embedding is idempotent); read timeouts go through _post_embed.
+_retry = Retry(
+    total=5, read=False, backoff_factor=1.5,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods=None, raise_on_status=False
+)
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=_retry)
+_session.mount('http://', _adapter)
+_session.mount('https://', _adapter)
+
+logger = logging.getLogger(__name__)
+
+def get_session() -> requests.Session:
+    """Return the shared HTTP session used for all Phi-4 API calls"""
+    return _session
+
+
+_warmed_up = False  # set once the embedding server has answered
+
+def _post_embed(url: str, payload: Dict, timeout: float) -> requests.Response:
+    """POST to the embedding API; until the server has answered once, a timeout
+    is retried one time with EMBED_WARMUP_TIMEOUT while the model loads.
+    """
+    global _warmed_up
+    try:
+        response = _session.post(url, json=payload, timeout=timeout)
+    except requests.exceptions.Timeout:
+        if _warmed_up:
+            raise
+        logger.warning(f"Embedding request timed out, retrying once with {EMBED_WARMUP_TIMEOUT}s timeout (model warm-up)")
+        response = _session.post(url, json=payload, timeout=EMBED_WARMUP_TIMEOUT)
+    _warmed_up = True
+    return response
+
+
 def embed_text(text: str) -> List[float]:
     """Generate embedding for text using Phi-4 API"""
     try:
-        response = requests.post(
-            EMBED_API_URL,
-            json={"text": text},
-            timeout=30
-        )
+        response = _post_embed(EMBED_API_URL, {"text": text}, EMBED_TIMEOUT)
         response.raise_for_status()
-        result = response.json()
+        result = json_loads(response.content)
         return result.get('embedding', [])
     except requests.exceptions.RequestException as e:
-        print(f"Error calling embedding API: {e}")
+        logger.error(f"Error calling embedding API: {e}")
         raise
 
-def load_document(doc: Dict, cur) -> None:
-    """Load a single document into Yugabyte with embedding"""
+def _embed_cache_path(text: str) -> Path:
+    """Cache file for a text, keyed by SHA-256 of the model name and text"""
+    key = hashlib.sha256(f"{EMBED_MODEL}\0{text}".encode('utf-8')).hexdigest()
+    return EMBED_CACHE_DIR / f"{key}.f32"
+
+def load_cached_embedding(text: str) -> Optional[List[float]]:
+    """Return the cached embedding for text, or None on a cache miss"""
+    path = _embed_cache_path(text)
     try:
-        # Generate embedding
-        print(f"Generating embedding for: {doc.get('source_name', 'unknown')}...")
-        embedding = embed_text(doc['content'])
-        
+        data = path.read_bytes()
+    except OSError:
+        return None
+    vec = array('f')
+    vec.frombytes(data[:len(data) - len(data) % vec.itemsize])
+    return vec.tolist() if len(vec) == 384 else None
+
+_cache_write_failed = False  # set once a cache write has failed, so the warning is logged once
+
+def save_cached_embedding(text: str, embedding: List[float]) -> None:
+    """Store an embedding in the on-disk cache as raw float32 values
+    Best effort: if EMBED_CACHE_DIR cannot be written, warn once and continue without caching.
+    """
+    global _cache_write_failed
+    path = _embed_cache_path(text)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_bytes(array('f', embedding).tobytes())
+        tmp_path.replace(path)
+    except OSError as e:
+        if not _cache_write_failed:
+            _cache_write_failed = True
+            logger.warning(f"Embedding cache {EMBED_CACHE_DIR} not writable, continuing without it: {e}")
+
+def embed_texts(texts: List[str]) -> List[Optional[List[float]]]:
+    """Generate embeddings for many texts, reusing cached embeddings for unchanged content.
+    Only cache misses are sent to the API (see _embed_uncached); a text whose embedding
+    failed gets None.
+    """
+    embeddings = [load_cached_embedding(text) for text in texts]
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if len(missing) < len(texts):
+        logger.info(f"Loaded {len(texts) - len(missing)} embeddings from cache {EMBED_CACHE_DIR}")
+    
+    for i, embedding in zip(missing, _embed_uncached([texts[i] for i in missing])):
+        if embedding is not None:
+            save_cached_embedding(texts[i], embedding)
+        embeddings[i] = embedding
+    return embeddings
+
+def _embed_uncached(texts: List[str]) -> List[Optional[List[float]]]:
+    """Generate embeddings for many texts with one batch call per EMBED_BATCH_SIZE texts.
+    Falls back to one embed_text call per text if the server has no batch endpoint, and
+    for a batch that fails. A text that still fails gets None.
+    """
+    embeddings = []
+    for start in range(0, len(texts), EMBED_BATCH_SIZE):
+        chunk = texts[start:start + EMBED_BATCH_SIZE]
+        try:
+            response = _post_embed(EMBED_BATCH_URL, {"texts": chunk}, EMBED_TIMEOUT * len(chunk))
+            if response.status_code in (404, 405):
+                logger.warning(f"Batch endpoint not available ({response.status_code}), embedding one text at a time")
+                return embeddings + [_embed_one(text) for text in texts[start:]]
+            response.raise_for_status()
+            batch = json_loads(response.content).get('embeddings', [])
+            if len(batch) != len(chunk):
+                raise ValueError(f"Expected {len(chunk)} embeddings, got {len(batch)}")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"Error calling batch embedding API, embedding this batch one text at a time: {e}")
+            batch = [_embed_one(text) for text in chunk]
+        embeddings.extend(batch)
+    return embeddings
+
+def _embed_one(text: str) -> Optional[List[float]]:
+    """embed_text, returning None instead of raising so one failure doesn't stop the load"""
+    try:
+        return embed_text(text)
+    except Exception as e:
+        logger.error(f"  ✗ Embedding failed: {e}")
+        return None
+
+@lru_cache(maxsize=None)
+def _vector_template(dim: int) -> str:
+    """Precompiled %-format template '[%.7g,...]' for a vector of the given dimension"""
+    return '[' + ','.join(['%.7g'] * dim) + ']'
+
+def format_embedding_for_pg(embedding: List[float]) -> str:
+    """Format embedding as PostgreSQL vector string '[0.1,0.2,...]' with fp32 precision (7 digits)"""
+    return _vector_template(len(embedding)) % tuple(embedding)
+
+def document_row(doc: Dict, embedding: List[float]) -> tuple:
+    """Build the rag_documents row for a document and its precomputed embedding"""
+    try:
+        if embedding is None:
+            raise ValueError("No embedding (embedding API call failed)")
         if len(embedding) != 384:
             raise ValueError(f"Expected 384-dimensional embedding, got {len(embedding)}")
         
-        # Insert into database
-        # Format embedding as PostgreSQL vector string: '[0.1,0.2,0.3,...]'
-        embedding_str = '[' + ','.join(map(str, embedding)) + ']'
+        embedding_str = format_embedding_for_pg(embedding)
         
-        cur.execute("""
-            INSERT INTO rag_documents
-            (source_type, component, source_name, keyspace, table_name,
-             domain, sub_domain, event_date, content, metadata, embedding)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::vector)
-        """, (
+        return (
             doc.get('source_type'),
             doc.get('component'),
             doc.get('source_name'),
@@ -65,18 +210,29 @@ def load_document(doc: Dict, cur) -> None:
             doc.get('sub_domain'),
             doc.get('event_date'),
             doc.get('content'),
-            json.dumps(doc.get('metadata', {})),
+            json_dumps(doc.get('metadata', {})),
             embedding_str
-        ))
-        
-        print(f"  ✓ Inserted: {doc.get('source_name')}")
+        )
         
     except Exception as e:
-        print(f"  ✗ Error loading {doc.get('source_name')}: {e}")
+        logger.error(f"  ✗ Error preparing {doc.get('source_name')}: {e}")
         raise
 
-def main():
-    """Main function to load all documents"""
+def load_documents(rows: List[tuple], cur) -> None:
+    """Bulk insert document rows into Yugabyte (one multi-row INSERT per 100 rows)"""
+    psycopg2.extras.execute_values(cur, """
+        INSERT INTO rag_documents
+        (source_type, component, source_name, keyspace, table_name,
+         domain, sub_domain, event_date, content, metadata, embedding)
+        VALUES %s
+    """, rows, template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::vector)", page_size=100)
+
+def main(verify: bool = False):
+    """Main function to load all documents
+    verify: run an exact COUNT(*) on rag_documents after the load
+    """
+    logging.basicConfig(stream=sys.stdout, level=LOG_LEVEL, format='%(message)s')
+    
     print("=" * 80)
     print("RAG MVP - Embedding Generation and Bulk Load")
     print("=" * 80)
@@ -84,18 +240,18 @@ def main():
     
     # Load metadata
     print("Loading metadata document...")
-    with open('data/metadata.json', 'r') as f:
-        metadata_doc = json.load(f)
+    with open('data/metadata.json', 'rb') as f:
+        metadata_doc = json_loads(f.read())
     
     # Load lineage
     print("Loading lineage document...")
-    with open('data/lineage.json', 'r') as f:
-        lineage_doc = json.load(f)
+    with open('data/lineage.json', 'rb') as f:
+        lineage_doc = json_loads(f.read())
     
     # Load logs and metrics
     print("Loading logs and metrics (7 days)...")
-    with open('data/logs_metrics_7days.json', 'r') as f:
-        logs_metrics = json.load(f)
+    with open('data/logs_metrics_7days.json', 'rb') as f:
+        logs_metrics = json_loads(f.read())
     
     # Combine all documents
     all_docs = [metadata_doc, lineage_doc] + logs_metrics
@@ -112,24 +268,42 @@ def main():
         print(f"✗ Database connection failed: {e}")
         sys.exit(1)
     
+    # Generate all embeddings up front in batched API calls
+    print(f"\nGenerating embeddings for {len(all_docs)} documents...")
+    try:
+        embeddings = embed_texts([doc['content'] for doc in all_docs])
+        print(f"✓ Generated {len(embeddings)} embeddings")
+    except Exception as e:
+        print(f"✗ Embedding generation failed: {e}")
+        cur.close()
+        conn.close()
+        sys.exit(1)
+    
     # Load documents
-    print("\nGenerating embeddings and loading documents...")
+    print("\nLoading documents...")
     print("-" * 80)
     
     success_count = 0
     error_count = 0
     
-    for i, doc in enumerate(all_docs, 1):
+    rows = []
+    for doc, embedding in zip(all_docs, embeddings):
         try:
-            print(f"[{i}/{len(all_docs)}] ", end="")
-            load_document(doc, cur)
-            conn.commit()
-            success_count += 1
-        except Exception as e:
-            print(f"  Error: {e}")
-            conn.rollback()
+            rows.append(document_row(doc, embedding))
+        except Exception:
             error_count += 1
     
+    # Insert all rows and commit once; a failure rolls back the whole batch
+    try:
+        load_documents(rows, cur)
+        conn.commit()
+        success_count = len(rows)
+        print(f"  ✓ Inserted {len(rows)} documents")
+    except Exception as e:
+        print(f"  ✗ Bulk insert failed, rolled back: {e}")
+        conn.rollback()
+        error_count += len(rows)
+    
     # Summary
     print()
     print("=" * 80)
@@ -140,10 +314,19 @@ def main():
     print(f"Total: {len(all_docs)}")
     print()
     
-    # Verify count
-    cur.execute("SELECT COUNT(*) FROM rag_documents")
-    count = cur.fetchone()[0]
-    print(f"Total documents in database: {count}")
+    # Verify count: exact COUNT(*) scans every tablet, so only run it with --verify;
+    # otherwise report the planner's catalog estimate
+    if verify:
+        cur.execute("SELECT COUNT(*) FROM rag_documents")
+        count = cur.fetchone()[0]
+        print(f"Total documents in database: {count}")
+    else:
+        cur.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = 'rag_documents'")
+        row = cur.fetchone()
+        if row and row[0] >= 0:
+            print(f"Total documents in database (estimate): {row[0]} (use --verify for an exact count)")
+        else:
+            print("Total documents in database: not yet analyzed (use --verify for an exact count)")
     
     cur.close()
     conn.close()
@@ -155,5 +338,5 @@ if __name__ == "__main__":
     os.chdir(script_dir)
     os.chdir('..')  # Go to mvp directory
     
-    main()
+    main(verify='--verify' in sys.argv[1:])
 
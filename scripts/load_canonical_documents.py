@@ -5,15 +5,53 @@ Generates embeddings using Phi-4 API and inserts documents with proper doc_sub_t
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import psycopg2
+import psycopg2.extras
+import psycopg2.pool
+import asyncio
+import hashlib
+import io
 import json
+import logging
 import os
+import queue
+import random
+import struct
 import sys
+import threading
+import time
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from datetime import date
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple, Union
+
+try:
+    import orjson  # optional: 2-5x faster JSON parsing and serialization
+except ImportError:
+    orjson = None
+
+try:
+    import httpx  # optional: async fan-out of single-text embedding requests
+    import h2  # noqa: F401  (required by httpx for HTTP/2)
+except ImportError:
+    httpx = None
+
+if orjson is not None:
+    json_loads = orjson.loads
+
+    def json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+else:
+    json_loads = json.loads
+    json_dumps = json.dumps
 
 # Configuration
 PHI4_EMBED_URL = os.getenv("PHI4_EMBED_URL", "http://localhost:8083/api/embed")
+PHI4_EMBED_BATCH_URL = os.getenv("PHI4_EMBED_BATCH_URL", PHI4_EMBED_URL.replace("/api/embed", "/api/embed_batch"))
 PG_CONN = {
     "host": os.getenv("DB_HOST", "localhost"),
     "port": int(os.getenv("DB_PORT", "5433")),
@@ -22,11 +60,106 @@ PG_CONN = {
     "password": os.getenv("DB_PASSWORD", "yugabyte")
 }
 
+# Log level for per-request/per-document output (DEBUG shows every document)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+logger = logging.getLogger(__name__)
+
 # Timeout for embedding generation
 EMBED_TIMEOUT = 120
 
+# Read timeout for the one retry of the first embedding request if it times out
+# (the model may still be loading on a cold server)
+EMBED_WARMUP_TIMEOUT = int(os.getenv("EMBED_WARMUP_TIMEOUT", "600"))
+
+# Embedding model name; part of the cache key so a model change invalidates cached embeddings
+EMBED_MODEL = os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2")
+
+# On-disk embedding cache (one raw float32 file per content hash); delete the directory to clear it
+EMBED_CACHE_DIR = Path(os.getenv("EMBED_CACHE_DIR", Path(__file__).resolve().parent.parent / ".embed_cache"))
+
+# Number of texts sent per /api/embed_batch request
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+
+# Number of embedding requests in flight at once
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))
+
+# Storage type of rag_documents.embedding: "vector" (fp32) or "halfvec" (fp16, see sql/04_migrate_embedding_halfvec.sql)
+EMBEDDING_TYPE = os.getenv("EMBEDDING_TYPE", "vector")
+
+# How rows are written: "copy" (COPY FROM STDIN, text), "binary" (COPY FROM STDIN,
+# binary: embeddings sent as raw float4/float2 values), "insert" (multi-row INSERT)
+# or "prepared" (EXECUTE of a statement prepared once per writer connection)
+LOAD_METHOD = os.getenv("LOAD_METHOD", "copy")
+
+# Set REBUILD_VECTOR_INDEX=1 to drop the HNSW index before loading and rebuild it once afterwards
+# (worth it for large loads; for a handful of documents incremental index updates are cheaper).
+# Every HNSW index on rag_documents and its partitions (sql/06_partition_rag_documents.sql)
+# is rebuilt from its own definition; VECTOR_INDEX_NAME is created only if there was none.
+REBUILD_VECTOR_INDEX = os.getenv("REBUILD_VECTOR_INDEX", "0") == "1"
+VECTOR_INDEX_NAME = "idx_rag_embedding_hnsw"
+
+# Embedded documents buffered between the embedding workers and the DB writer
+PIPELINE_QUEUE_SIZE = 32
 
-def get_embedding(text: str) -> List[float]:
+# Maximum rows written per flush by the DB writer
+INSERT_FLUSH_SIZE = int(os.getenv("INSERT_FLUSH_SIZE", "50"))
+
+# Parallel DB writer threads, each with its own pooled connection. Rows are
+# partitioned by source_name; more than ~4 concurrent writers tends to regress.
+DB_WRITERS = int(os.getenv("DB_WRITERS", "2"))
+
+# Shared HTTP session: pools and keeps alive connections to the Phi-4 server.
+# Connection errors and 429/5xx responses are retried with exponential backoff
+# (embedding calls are idempotent, so POST is retried too); read timeouts are
+# not, a slow inference is handled by _post_embed instead.
+_retry = Retry(
+    total=5, read=False, backoff_factor=1.5,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods=None, raise_on_status=False
+)
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=_retry)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
+
+
+def get_session() -> requests.Session:
+    """Return the shared HTTP session used for all Phi-4 API calls."""
+    return _session
+
+
+# Set once the embedding server has answered a request
+_warmed_up = threading.Event()
+
+
+def _post_embed(url: str, payload: Dict, timeout: float) -> requests.Response:
+    """
+    POST to the embedding API on the shared session.
+    
+    Until the server has answered once, a timed-out request is retried one
+    time with EMBED_WARMUP_TIMEOUT, since the first call may have to wait for
+    the model to load. Later timeouts are raised to the caller.
+    """
+    try:
+        response = _session.post(url, json=payload, timeout=timeout)
+    except requests.exceptions.Timeout:
+        if _warmed_up.is_set():
+            raise
+        logger.warning(f"⚠️  Embedding request timed out, retrying once with {EMBED_WARMUP_TIMEOUT}s timeout (model warm-up)")
+        response = _session.post(url, json=payload, timeout=EMBED_WARMUP_TIMEOUT)
+    _warmed_up.set()
+    return response
+
+
+def _to_vector(embedding) -> array:
+    """Validate a decoded JSON embedding and pack it into a float32 array (4 bytes per value)."""
+    if not isinstance(embedding, list) or len(embedding) != 384:
+        raise ValueError(f"Expected 384-dimensional embedding, got {len(embedding) if isinstance(embedding, list) else 'non-list'}")
+    return array("f", embedding)
+
+
+def get_embedding(text: str) -> array:
     """
     Generate embedding for text using Phi-4 API.
     
@@ -34,16 +167,12 @@ def get_embedding(text: str) -> List[float]:
         text: Text to embed
         
     Returns:
-        List of float values representing the embedding vector
+        float32 array representing the embedding vector
     """
     try:
-        response = requests.post(
-            PHI4_EMBED_URL,
-            json={"text": text},
-            timeout=EMBED_TIMEOUT
-        )
+        response = _post_embed(PHI4_EMBED_URL, {"text": text}, EMBED_TIMEOUT)
         response.raise_for_status()
-        data = response.json()
+        data = json_loads(response.content)
         
         # Expect: {"embedding": [0.0123, ...]} or {"status": "success", "embedding": [...]}
         if "embedding" in data:
@@ -53,88 +182,654 @@ def get_embedding(text: str) -> List[float]:
         else:
             raise ValueError(f"Unexpected response format: {data}")
         
-        if not isinstance(embedding, list) or len(embedding) != 384:
-            raise ValueError(f"Expected 384-dimensional embedding, got {len(embedding) if isinstance(embedding, list) else 'non-list'}")
+        return _to_vector(embedding)
+        
+    except requests.exceptions.RequestException as e:
+        logger.error(f"❌ Error calling Phi-4 embedding API: {e}")
+        raise
+    except (KeyError, ValueError) as e:
+        logger.error(f"❌ Error parsing embedding response: {e}")
+        raise
+
+
+async def embed_many(texts: List[str]) -> List[Union[array, Exception]]:
+    """
+    Generate embeddings for texts with concurrent single-text requests.
+    
+    All requests share one httpx.AsyncClient, with at most EMBED_WORKERS in
+    flight. Over https the client negotiates HTTP/2 and multiplexes them on a
+    single connection; over plain http it pools HTTP/1.1 connections. A text
+    whose request fails is retried with get_embedding on the shared session
+    (retry backoff and model warm-up). Requires the optional httpx and h2 packages.
+    
+    Args:
+        texts: Texts to embed
+        
+    Returns:
+        One embedding per input text, in input order, or the exception for a
+        text that could not be embedded
+    """
+    slots = asyncio.Semaphore(EMBED_WORKERS)
+    
+    async def embed(client: "httpx.AsyncClient", text: str) -> array:
+        async with slots:
+            response = await client.post(PHI4_EMBED_URL, json={"text": text})
+        response.raise_for_status()
+        _warmed_up.set()
+        return _to_vector(json_loads(response.content).get("embedding"))
+    
+    async with httpx.AsyncClient(http2=True, timeout=EMBED_TIMEOUT) as client:
+        results = await asyncio.gather(*(embed(client, text) for text in texts), return_exceptions=True)
+    
+    for i, (text, result) in enumerate(zip(texts, results)):
+        if isinstance(result, Exception):
+            logger.warning(f"⚠️  Embedding request failed, retrying on the shared session: {result}")
+            try:
+                results[i] = await asyncio.to_thread(get_embedding, text)
+            except Exception as e:
+                results[i] = e
+    return results
+
+
+def _embed_cache_path(text: str) -> Path:
+    """Return the cache file for a text, keyed by SHA-256 of the model name and text."""
+    key = hashlib.sha256(f"{EMBED_MODEL}\0{text}".encode("utf-8")).hexdigest()
+    return EMBED_CACHE_DIR / f"{key}.f32"
+
+
+def load_cached_embedding(text: str) -> Optional[array]:
+    """
+    Look up a previously computed embedding in the on-disk cache.
+    
+    Args:
+        text: Text that was embedded
+        
+    Returns:
+        The cached embedding, or None on a cache miss
+    """
+    path = _embed_cache_path(text)
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return None
+    vec = array("f")
+    vec.frombytes(data[:len(data) - len(data) % vec.itemsize])
+    return vec if len(vec) == 384 else None
+
+
+# Set once a cache write has failed, so the warning is logged only once
+_cache_write_failed = threading.Event()
+
+
+def save_cached_embedding(text: str, embedding: array) -> None:
+    """
+    Store an embedding in the on-disk cache as raw float32 values.
+    
+    The cache is best effort: if EMBED_CACHE_DIR cannot be written, a warning
+    is logged once and the load carries on without caching.
+    
+    Args:
+        text: Text that was embedded
+        embedding: Its embedding vector
+    """
+    path = _embed_cache_path(text)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(embedding.tobytes())
+        tmp_path.replace(path)
+    except OSError as e:
+        if not _cache_write_failed.is_set():
+            _cache_write_failed.set()
+            logger.warning(f"⚠️  Embedding cache {EMBED_CACHE_DIR} not writable, continuing without it: {e}")
+
+
+def _embed_batch(texts: List[str]) -> Optional[List[array]]:
+    """
+    Generate embeddings for one chunk of texts with a single batch API call.
+    
+    Args:
+        texts: Texts to embed (at most EMBED_BATCH_SIZE)
         
-        return embedding
+    Returns:
+        One embedding per input text, or None if the server has no batch endpoint
+    """
+    try:
+        response = _post_embed(PHI4_EMBED_BATCH_URL, {"texts": texts}, EMBED_TIMEOUT * len(texts))
+        if response.status_code in (404, 405):
+            return None
+        response.raise_for_status()
+        batch = json_loads(response.content).get("embeddings")
+        
+        if not isinstance(batch, list) or len(batch) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(batch) if isinstance(batch, list) else 'non-list'}")
+        
+        return [_to_vector(embedding) for embedding in batch]
         
     except requests.exceptions.RequestException as e:
-        print(f"❌ Error calling Phi-4 embedding API: {e}")
+        logger.error(f"❌ Error calling Phi-4 batch embedding API: {e}")
         raise
     except (KeyError, ValueError) as e:
-        print(f"❌ Error parsing embedding response: {e}")
+        logger.error(f"❌ Error parsing batch embedding response: {e}")
         raise
 
 
-def format_embedding_for_pg(embedding: List[float]) -> str:
+def _jittered(func, arg):
+    """Call func(arg) after a small random delay so concurrent requests don't arrive in lockstep."""
+    time.sleep(random.uniform(0, 0.05))
+    return func(arg)
+
+
+def _route(outs: List[queue.Queue], item: tuple) -> None:
+    """Queue an embedded document for the writer that owns its source_name partition."""
+    outs[hash(item[1].get("source_name")) % len(outs)].put(item)
+
+
+class EmbedderClient:
+    """
+    Coalesces embedding requests submitted close together into batch API calls.
+    
+    Callers submit() single texts and get a Future back. A flush thread
+    collects texts until max_batch are waiting or flush_interval_ms has passed
+    since the first one, then hands the batch to a pool of max_workers sender
+    threads. Each batch is one /api/embed_batch call; if the server has no
+    batch endpoint, texts are sent through embed_many (httpx) or as parallel
+    single-text calls on the shared session. Futures resolve in input order.
+    """
+    
+    def __init__(self, flush_interval_ms: int = 20, max_batch: int = EMBED_BATCH_SIZE,
+                 max_workers: int = EMBED_WORKERS):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self.batch_supported = True
+        self._pending = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._fan_out_lock = threading.Lock()  # one embed_many at a time keeps EMBED_WORKERS requests in flight
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+    
+    def submit(self, text: str) -> Future:
+        """Queue a text for embedding; the Future resolves to its embedding."""
+        future = Future()
+        self._pending.put((text, future))
+        return future
+    
+    def close(self) -> None:
+        """Flush queued texts and wait for every in-flight request to finish."""
+        self._pending.put(None)
+        self._flusher.join()
+        self._executor.shutdown(wait=True)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def _flush_loop(self) -> None:
+        """Group queued texts into batches and dispatch them until close()."""
+        closed = False
+        while not closed:
+            item = self._pending.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._pending.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    closed = True
+                    break
+                batch.append(item)
+            self._executor.submit(self._send_batch, batch)
+    
+    def _send_batch(self, batch: List[tuple]) -> None:
+        """Embed one batch of (text, future) pairs and resolve the futures."""
+        texts = [text for text, _ in batch]
+        try:
+            embeddings = _jittered(_embed_batch, texts) if self.batch_supported else None
+        except Exception as e:
+            # One bad text fails the whole batch call; retry each text alone so only it fails
+            logger.warning(f"⚠️  Batch embedding failed, embedding its {len(batch)} texts one at a time: {e}")
+            self._send_each(batch)
+            return
+        try:
+            if embeddings is None:
+                if self.batch_supported:
+                    logger.warning("⚠️  Batch endpoint not available, embedding one text at a time")
+                    self.batch_supported = False
+                if httpx is None:
+                    self._send_each(batch)
+                    return
+                with self._fan_out_lock:
+                    embeddings = asyncio.run(embed_many(texts))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), embedding in zip(batch, embeddings):
+            if isinstance(embedding, Exception):
+                future.set_exception(embedding)
+            else:
+                future.set_result(embedding)
+    
+    def _send_each(self, batch: List[tuple]) -> None:
+        """Embed each (text, future) pair of a batch with its own /api/embed call."""
+        for text, future in batch:
+            self._executor.submit(self._send_one, text, future)
+    
+    def _send_one(self, text: str, future: Future) -> None:
+        """Embed a single text with /api/embed and resolve its future."""
+        try:
+            future.set_result(_jittered(get_embedding, text))
+        except Exception as e:
+            future.set_exception(e)
+
+
+def produce_embeddings(docs: List[tuple], outs: List[queue.Queue]) -> int:
+    """
+    Embed documents concurrently and hand them to the DB writers.
+    
+    Documents whose content is in the on-disk cache are queued immediately.
+    The rest are submitted to an EmbedderClient, which coalesces them into
+    batch requests. Each (doc_file, doc, embedding) is cached and routed to a
+    writer queue as soon as its embedding arrives.
+    
+    Args:
+        docs: (doc_file, doc) pairs to embed
+        outs: Writer queues consumed by consume_documents, one per DB writer
+        
+    Returns:
+        Number of documents whose embedding failed
+    """
+    failed_count = 0
+    
+    cached, uncached = [], []
+    for doc_file, doc in docs:
+        embedding = load_cached_embedding(doc["content"])
+        if embedding is None:
+            uncached.append((doc_file, doc))
+        else:
+            cached.append((doc_file, doc, embedding))
+    if cached:
+        logger.info(f"💾 {len(cached)} embeddings loaded from cache {EMBED_CACHE_DIR}")
+    for item in cached:
+        _route(outs, item)
+    
+    with EmbedderClient() as client:
+        pending = {client.submit(doc["content"]): (doc_file, doc) for doc_file, doc in uncached}
+        for future in as_completed(pending):
+            doc_file, doc = pending[future]
+            try:
+                embedding = future.result()
+            except Exception as e:
+                logger.error(f"❌ Error embedding {doc_file}: {e}")
+                failed_count += 1
+                continue
+            save_cached_embedding(doc["content"], embedding)
+            _route(outs, (doc_file, doc, embedding))
+    
+    return failed_count
+
+
+# Significant digits that survive a round trip through each storage type
+_EMBEDDING_DIGITS = {"vector": 7, "halfvec": 5}
+
+
+@lru_cache(maxsize=None)
+def _vector_template(dim: int, digits: int) -> str:
+    """Return a %-format template "[%.<digits>g,...]" for a vector of the given dimension."""
+    return "[" + ",".join([f"%.{digits}g"] * dim) + "]"
+
+
+def format_embedding_for_pg(embedding: array, dtype: str = EMBEDDING_TYPE) -> str:
     """
     Format embedding list as PostgreSQL vector string.
     
+    Floats are written through one precompiled %-format template with only
+    the significant digits the column keeps: 7 for fp32 vector, 5 for fp16
+    halfvec. This is faster and smaller than joining str() of every element.
+    
     Args:
-        embedding: List of float values
+        embedding: float32 array (or list) of values
+        dtype: Column type the string will be cast to ("vector" or "halfvec")
         
     Returns:
         PostgreSQL vector string format: "[0.1,0.2,...]"
     """
-    return "[" + ",".join(map(str, embedding)) + "]"
+    return _vector_template(len(embedding), _EMBEDDING_DIGITS[dtype]) % tuple(embedding)
+
+
+INSERT_COLUMNS = """
+(cluster_name, source_type, doc_sub_type, entity_type, component, source_name, 
+ keyspace, table_name, domain, sub_domain, event_date, time_window, 
+ content, metadata, embedding)
+"""
+
+# Bulk INSERT: execute_values expands VALUES %s into one multi-row statement per page
+INSERT_SQL = "INSERT INTO rag_documents" + INSERT_COLUMNS + "VALUES %s"
+INSERT_TEMPLATE = f"(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::jsonb, %s::{EMBEDDING_TYPE})"
+INSERT_PAGE_SIZE = 100
 
+# Server-side prepared INSERT: parsed and planned once per connection, then
+# each row is an EXECUTE (execute_batch sends a page of them per round trip)
+PREPARE_SQL = (
+    "PREPARE ins_rag (text, text, text, text, text, text, text, text, text, text, "
+    f"date, text, text, jsonb, {EMBEDDING_TYPE}) AS INSERT INTO rag_documents" + INSERT_COLUMNS
+    + "VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15)"
+)
+EXECUTE_SQL = "EXECUTE ins_rag (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
 
-def insert_document(doc: Dict, cur) -> None:
+# COPY in text format: jsonb and vector/halfvec columns parse their text forms directly
+COPY_SQL = "COPY rag_documents" + INSERT_COLUMNS + "FROM STDIN WITH (FORMAT text)"
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+# COPY in binary format: every field is sent in its type's binary wire format
+COPY_BINARY_SQL = "COPY rag_documents" + INSERT_COLUMNS + "FROM STDIN WITH (FORMAT binary)"
+_COPY_BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+_COPY_BINARY_TRAILER = struct.pack("!h", -1)
+_PG_EPOCH = date(2000, 1, 1)
+_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def build_document_row(doc: Dict, embedding: array) -> tuple:
     """
-    Insert a document into rag_documents table.
+    Build the rag_documents row for a document.
     
     Args:
         doc: Document dictionary with all fields
+        embedding: Precomputed embedding for the document content
+        
+    Returns:
+        Row tuple in INSERT_COLUMNS order; the embedding is left as an array
+        so each write method can encode it (text or binary)
+    """
+    # Prepare metadata as JSON string
+    metadata_json = json_dumps(doc.get("metadata", {}))
+    
+    # Parse event_date (YYYY-MM-DD) if present
+    event_date = date.fromisoformat(doc["event_date"]) if doc.get("event_date") else None
+    
+    return (
+        doc.get("cluster_name"),
+        doc.get("source_type"),
+        doc.get("doc_sub_type"),
+        doc.get("entity_type"),
+        doc.get("component"),
+        doc.get("source_name"),
+        doc.get("keyspace"),
+        doc.get("table_name"),
+        doc.get("domain"),
+        doc.get("sub_domain"),
+        event_date,
+        doc.get("time_window"),
+        doc.get("content"),
+        metadata_json,
+        embedding
+    )
+
+
+def insert_documents(rows: List[tuple], cur) -> None:
+    """
+    Insert document rows into rag_documents table in bulk.
+    
+    Uses psycopg2.extras.execute_values so each page of INSERT_PAGE_SIZE
+    rows is sent as a single multi-row INSERT. The caller commits.
+    
+    Args:
+        rows: Row tuples from build_document_row
         cur: Database cursor
     """
-    try:
-        # Generate embedding for content
-        print(f"  📝 Generating embedding for {doc.get('doc_sub_type')}...")
-        embedding = get_embedding(doc["content"])
-        embedding_pg = format_embedding_for_pg(embedding)
-        
-        # Prepare metadata as JSON string
-        metadata_json = json.dumps(doc.get("metadata", {}))
-        
-        # SQL INSERT with all fields
-        sql = """
-        INSERT INTO rag_documents
-        (cluster_name, source_type, doc_sub_type, entity_type, component, source_name, 
-         keyspace, table_name, domain, sub_domain, event_date, time_window, 
-         content, metadata, embedding)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::jsonb, %s::vector)
-        """
-        
-        # Parse event_date if present
-        event_date = None
-        if "event_date" in doc and doc["event_date"]:
-            from datetime import datetime
-            event_date = datetime.strptime(doc["event_date"], "%Y-%m-%d").date()
-        
-        params = (
-            doc.get("cluster_name"),
-            doc.get("source_type"),
-            doc.get("doc_sub_type"),
-            doc.get("entity_type"),
-            doc.get("component"),
-            doc.get("source_name"),
-            doc.get("keyspace"),
-            doc.get("table_name"),
-            doc.get("domain"),
-            doc.get("sub_domain"),
-            event_date,
-            doc.get("time_window"),
-            doc.get("content"),
-            metadata_json,
-            embedding_pg
-        )
-        
-        cur.execute(sql, params)
-        print(f"  ✅ Inserted {doc.get('doc_sub_type')}")
+    psycopg2.extras.execute_values(
+        cur, INSERT_SQL, [row[:-1] + (format_embedding_for_pg(row[-1]),) for row in rows],
+        template=INSERT_TEMPLATE, page_size=INSERT_PAGE_SIZE
+    )
+
+
+def prepare_insert(cur) -> None:
+    """Prepare the ins_rag statement on the cursor's connection (once per connection)."""
+    cur.execute(PREPARE_SQL)
+
+
+def execute_prepared(rows: List[tuple], cur) -> None:
+    """
+    Insert document rows by executing the prepared ins_rag statement.
+    
+    The server skips parse/plan for every row; psycopg2.extras.execute_batch
+    sends INSERT_PAGE_SIZE EXECUTEs per round trip. Requires prepare_insert
+    on the same connection. The caller commits.
+    
+    Args:
+        rows: Row tuples from build_document_row
+        cur: Database cursor
+    """
+    psycopg2.extras.execute_batch(
+        cur, EXECUTE_SQL, [row[:-1] + (format_embedding_for_pg(row[-1]),) for row in rows],
+        page_size=INSERT_PAGE_SIZE
+    )
+
+
+def copy_documents(rows: List[tuple], cur) -> None:
+    """
+    Stream document rows into rag_documents table with COPY FROM STDIN.
+    
+    Rows are serialized to COPY text format in memory (tab-separated,
+    backslash escapes, \\N for NULL) and sent in one COPY. The caller commits.
+    
+    Args:
+        rows: Row tuples from build_document_row
+        cur: Database cursor
+    """
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(
+            "\\N" if value is None else str(value).translate(_COPY_ESCAPES)
+            for value in row[:-1]
+        ))
+        buf.write("\t")
+        buf.write(format_embedding_for_pg(row[-1]))
+        buf.write("\n")
+    buf.seek(0)
+    cur.copy_expert(COPY_SQL, buf)
+
+
+def _binary_field(value, pg_type: str) -> bytes:
+    """Encode one COPY binary field: int32 length followed by the value's wire format."""
+    if value is None:
+        return struct.pack("!i", -1)
+    if pg_type == "date":
+        data = struct.pack("!i", (value - _PG_EPOCH).days)
+    elif pg_type == "jsonb":
+        data = b"\x01" + value.encode("utf-8")  # jsonb binary format version 1
+    elif pg_type == "vector":
+        values = array("f", value)
+        if _LITTLE_ENDIAN:
+            values.byteswap()
+        data = struct.pack("!hh", len(values), 0) + values.tobytes()
+    elif pg_type == "halfvec":
+        data = struct.pack(f"!hh{len(value)}e", len(value), 0, *value)
+    else:
+        data = str(value).encode("utf-8")
+    return struct.pack("!i", len(data)) + data
+
+
+# Wire types of the INSERT_COLUMNS fields, in order
+_COLUMN_TYPES = ("text",) * 10 + ("date", "text", "text", "jsonb", EMBEDDING_TYPE)
+
+
+def copy_documents_binary(rows: List[tuple], cur) -> None:
+    """
+    Stream document rows into rag_documents table with binary COPY FROM STDIN.
+    
+    Embeddings go over the wire as pgvector's binary format (int16 dim,
+    int16 unused, then big-endian float4 - or float2 for halfvec - values),
+    so neither side formats or parses ~4 KB of float text per row. The
+    caller commits.
+    
+    Args:
+        rows: Row tuples from build_document_row
+        cur: Database cursor
+    """
+    buf = io.BytesIO()
+    buf.write(_COPY_BINARY_HEADER)
+    field_count = struct.pack("!h", len(_COLUMN_TYPES))
+    for row in rows:
+        buf.write(field_count)
+        for value, pg_type in zip(row, _COLUMN_TYPES):
+            buf.write(_binary_field(value, pg_type))
+    buf.write(_COPY_BINARY_TRAILER)
+    buf.seek(0)
+    cur.copy_expert(COPY_BINARY_SQL, buf)
+
+
+def write_documents(rows: List[tuple], cur) -> None:
+    """Write document rows with the configured LOAD_METHOD."""
+    if LOAD_METHOD == "copy":
+        copy_documents(rows, cur)
+    elif LOAD_METHOD == "binary":
+        copy_documents_binary(rows, cur)
+    elif LOAD_METHOD == "prepared":
+        execute_prepared(rows, cur)
+    else:
+        insert_documents(rows, cur)
+
+
+def consume_documents(source: queue.Queue, conn, cur, counts: Dict[str, int]) -> None:
+    """
+    Drain embedded documents from the queue and write them in batches.
+    
+    Runs on its own thread while embeddings are still being produced. Takes
+    whatever is queued (up to INSERT_FLUSH_SIZE rows) and writes it in one
+    COPY/INSERT. All flushes of this writer share one transaction that is
+    committed once after the None end-of-stream item; a failed flush is rolled
+    back to its savepoint without losing earlier flushes. If the connection
+    itself fails, the writer is marked broken: everything staged and every
+    later item is counted as failed, and the queue is still drained to the
+    end so producers never block on it.
+    
+    Args:
+        source: Queue filled by produce_embeddings
+        conn: Database connection (used only by this thread)
+        cur: Database cursor
+        counts: Updated in place with "loaded" and "failed" totals
+    """
+    staged = 0
+    broken = False
+    done = False
+    while not done:
+        items = [source.get()]
+        while len(items) < INSERT_FLUSH_SIZE:
+            try:
+                items.append(source.get_nowait())
+            except queue.Empty:
+                break
+        if None in items:
+            done = True
+            items = [item for item in items if item is not None]
         
+        if broken:
+            counts["failed"] += len(items)
+            continue
+        
+        rows = []
+        for doc_file, doc, embedding in items:
+            try:
+                rows.append(build_document_row(doc, embedding))
+                logger.debug(f"📄 Prepared {doc_file} ({doc.get('doc_sub_type')})")
+            except Exception as e:
+                logger.error(f"❌ Error preparing {doc_file}: {e}")
+                counts["failed"] += 1
+        
+        if not rows:
+            continue
+        try:
+            cur.execute("SAVEPOINT flush")
+            try:
+                write_documents(rows, cur)
+                cur.execute("RELEASE SAVEPOINT flush")
+                staged += len(rows)
+                logger.info(f"✅ Inserted {len(rows)} documents")
+            except Exception as e:
+                logger.error(f"❌ Error inserting documents, rolling back batch: {e}")
+                cur.execute("ROLLBACK TO SAVEPOINT flush")
+                counts["failed"] += len(rows)
+        except Exception as e:
+            # SAVEPOINT/ROLLBACK itself failed: the connection is unusable
+            logger.error(f"❌ Database writer failed, counting its remaining documents as failed: {e}")
+            counts["failed"] += staged + len(rows)
+            staged = 0
+            broken = True
+    
+    if broken:
+        return
+    try:
+        conn.commit()
+        counts["loaded"] += staged
     except Exception as e:
-        print(f"  ❌ Error inserting {doc.get('doc_sub_type')}: {e}")
-        raise
+        logger.error(f"❌ Error committing documents: {e}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        counts["failed"] += staged
+
+
+# HNSW indexes on rag_documents itself and on each of its partitions
+VECTOR_INDEXES_SQL = """
+    SELECT c.relname, pg_get_indexdef(c.oid)
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    JOIN pg_am a ON a.oid = c.relam
+    WHERE a.amname = 'hnsw'
+      AND i.indrelid IN (
+          SELECT 'rag_documents'::regclass
+          UNION ALL
+          SELECT inhrelid FROM pg_inherits WHERE inhparent = 'rag_documents'::regclass
+      )
+"""
+
+
+def drop_vector_index(conn, cur) -> List[Tuple[str, str]]:
+    """
+    Drop the HNSW embedding indexes so the bulk load doesn't update them row by row.
+    
+    Returns:
+        (name, definition) of each dropped index, for create_vector_index
+    """
+    cur.execute(VECTOR_INDEXES_SQL)
+    indexes = cur.fetchall()
+    for name, definition in indexes:
+        # Logged first so an index can be recreated by hand if the rebuild never runs
+        logger.info(f"📝 {name}: {definition}")
+        cur.execute(f'DROP INDEX IF EXISTS "{name}"')
+    conn.commit()
+    for name, _ in indexes:
+        logger.info(f"🗑️  Dropped {name} for bulk load")
+    return indexes
+
+
+def create_vector_index(conn, cur, indexes: List[Tuple[str, str]]) -> None:
+    """
+    Rebuild the HNSW embedding indexes dropped by drop_vector_index, with their original
+    parameters; with none, create VECTOR_INDEX_NAME as in sql/02_create_schema_hnsw_384.sql.
+    """
+    if not indexes:
+        indexes = [(VECTOR_INDEX_NAME, f"""
+            CREATE INDEX IF NOT EXISTS {VECTOR_INDEX_NAME}
+              ON rag_documents USING hnsw (embedding {EMBEDDING_TYPE}_cosine_ops)
+              WITH (m = 16, ef_construction = 64)
+        """)]
+    for name, definition in indexes:
+        logger.info(f"🏗️  Rebuilding {name}...")
+        cur.execute(definition)
+        conn.commit()
+        logger.info(f"✅ Rebuilt {name}")
 
 
 def load_all_documents(data_dir: Path) -> None:
@@ -164,11 +859,13 @@ def load_all_documents(data_dir: Path) -> None:
     print(f"🔗 Phi-4 Embedding API: {PHI4_EMBED_URL}")
     print(f"🗄️  Database: {PG_CONN['host']}:{PG_CONN['port']}/{PG_CONN['dbname']}\n")
     
-    # Connect to database
+    # Connect to database: one connection for this thread plus one per writer
     try:
-        conn = psycopg2.connect(**PG_CONN)
+        pool = psycopg2.pool.ThreadedConnectionPool(1, DB_WRITERS + 1, **PG_CONN)
+        conn = pool.getconn()
+        conn.autocommit = False
         cur = conn.cursor()
-        print("✅ Connected to YugabyteDB\n")
+        print(f"✅ Connected to YugabyteDB ({DB_WRITERS} writer connections)\n")
     except Exception as e:
         print(f"❌ Error connecting to database: {e}")
         sys.exit(1)
@@ -177,6 +874,8 @@ def load_all_documents(data_dir: Path) -> None:
     failed_count = 0
     
     try:
+        # Pass 1: read all documents
+        docs = []
         for doc_file in doc_files:
             file_path = data_dir / doc_file
             if not file_path.exists():
@@ -185,20 +884,48 @@ def load_all_documents(data_dir: Path) -> None:
                 continue
             
             try:
-                with open(file_path, 'r') as f:
-                    doc = json.load(f)
-                
-                print(f"📄 Loading {doc_file} ({doc.get('doc_sub_type')})...")
-                insert_document(doc, cur)
-                conn.commit()
-                loaded_count += 1
-                print()
-                
+                docs.append((doc_file, json_loads(file_path.read_bytes())))
             except Exception as e:
-                print(f"❌ Error loading {doc_file}: {e}\n")
-                conn.rollback()
+                print(f"❌ Error reading {doc_file}: {e}\n")
                 failed_count += 1
-                continue
+        
+        if REBUILD_VECTOR_INDEX:
+            vector_indexes = drop_vector_index(conn, cur)
+        
+        try:
+            # Pass 2: embed on worker threads while the writer threads insert
+            print(f"📝 Generating embeddings for {len(docs)} documents...\n")
+            writer_conns = [pool.getconn() for _ in range(DB_WRITERS)]
+            pipelines = [queue.Queue(maxsize=PIPELINE_QUEUE_SIZE) for _ in writer_conns]
+            counts = [{"loaded": 0, "failed": 0} for _ in writer_conns]
+            writers = []
+            for writer_conn, pipeline, writer_counts in zip(writer_conns, pipelines, counts):
+                writer_conn.autocommit = False
+                writer_cur = writer_conn.cursor()
+                if LOAD_METHOD == "prepared":
+                    prepare_insert(writer_cur)
+                writer = threading.Thread(
+                    target=consume_documents,
+                    args=(pipeline, writer_conn, writer_cur, writer_counts)
+                )
+                writer.start()
+                writers.append(writer)
+            try:
+                failed_count += produce_embeddings(docs, pipelines)
+            finally:
+                for pipeline in pipelines:
+                    pipeline.put(None)
+                for writer in writers:
+                    writer.join()
+                for writer_conn in writer_conns:
+                    pool.putconn(writer_conn)
+            loaded_count += sum(c["loaded"] for c in counts)
+            failed_count += sum(c["failed"] for c in counts)
+        finally:
+            # Rebuild even if the load failed, or the dropped indexes would be lost
+            if REBUILD_VECTOR_INDEX:
+                conn.rollback()
+                create_vector_index(conn, cur, vector_indexes)
         
         print(f"\n{'='*60}")
         print(f"✅ Successfully loaded: {loaded_count} documents")
@@ -208,12 +935,16 @@ def load_all_documents(data_dir: Path) -> None:
         
     finally:
         cur.close()
-        conn.close()
-        print("\n🔌 Database connection closed")
+        pool.putconn(conn)
+        pool.closeall()
+        print("\n🔌 Database connections closed")
 
 
 def main():
     """Main entry point."""
+    logging.basicConfig(stream=sys.stdout, level=LOG_LEVEL, format="%(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # no "HTTP Request: POST ..." line per document
+    
     # Get data directory (default: mvp/data relative to script location)
     script_dir = Path(__file__).parent
     data_dir = script_dir.parent / "data"
@@ -225,7 +956,7 @@ def main():
     # Test Phi-4 API connection
     print("🔍 Testing Phi-4 embedding API...")
     try:
-        response = requests.get(PHI4_EMBED_URL.replace("/api/embed", "/health"), timeout=5)
+        response = _session.get(PHI4_EMBED_URL.replace("/api/embed", "/health"), timeout=5)
         if response.status_code == 200:
             print("✅ Phi-4 API is reachable\n")
         else:
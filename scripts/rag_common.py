@@ -0,0 +1,172 @@
+"""
+Shared pieces of the RAG test scripts (test_rag_query.py, test_rag_simple.py):
+search configuration, the on-disk query-embedding cache, pgvector literal
+formatting and building the LLM context from retrieved documents
+"""
+
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import struct
+import sys
+from functools import lru_cache
+from typing import Optional, Sequence
+
+# Tables that can be searched, and the filter that scopes each one to
+# dda_transactions: rag_documents (and the copy kept by
+# sql/06_partition_rag_documents.sql) hold every table's rows; the
+# rag_documents_dda partition holds only those rows and is searched unfiltered
+SEARCH_FILTERS = {
+    'rag_documents': "WHERE table_name = 'dda_transactions'",
+    'rag_documents_unpartitioned': "WHERE table_name = 'dda_transactions'",
+    'rag_documents_dda': "",
+}
+RAG_TABLE = os.environ.get('RAG_TABLE', 'rag_documents')
+if RAG_TABLE not in SEARCH_FILTERS:
+    print(f"✗ Unknown RAG_TABLE {RAG_TABLE!r}; expected one of: {', '.join(SEARCH_FILTERS)}")
+    sys.exit(1)
+SEARCH_FILTER = SEARCH_FILTERS[RAG_TABLE]
+
+# Storage type of rag_documents.embedding: "vector" (fp32) or "halfvec" (fp16,
+# see sql/04_migrate_embedding_halfvec.sql); the query vector is cast to match
+EMBEDDING_TYPE = os.environ.get('EMBEDDING_TYPE', 'vector')
+
+# When fewer than BRUTE_FORCE_THRESHOLD rows match the search filter, compute
+# the exact distance to each of them instead of walking the HNSW index (also
+# exact recall). Set to 0 to always use HNSW.
+BRUTE_FORCE_THRESHOLD = int(os.environ.get('BRUTE_FORCE_THRESHOLD', '2000'))
+
+# Prompt budget: each retrieved document's content is cut to MAX_CTX_CHARS and
+# documents are added (most relevant first) until MAX_PROMPT_CHARS is reached
+MAX_CTX_CHARS = int(os.environ.get('MAX_CTX_CHARS', '800'))
+MAX_PROMPT_CHARS = int(os.environ.get('MAX_PROMPT_CHARS', '4000'))
+
+# Persistent query-embedding cache shared across runs (EMBED_DISK_CACHE='' disables
+# it); entries are keyed by EMBED_MODEL and the query text
+EMBED_MODEL = os.environ.get('EMBED_MODEL', 'all-MiniLM-L6-v2')
+EMBED_DISK_CACHE = os.environ.get('EMBED_DISK_CACHE', os.path.expanduser('~/.cache/ragllmmvp/embed_cache.sqlite'))
+_disk_cache: Optional[sqlite3.Connection] = None
+_disk_cache_opened = False
+
+# Rows matching the search filter, counted only up to BRUTE_FORCE_THRESHOLD
+COUNT_FILTERED_SQL = f"""
+    SELECT count(*) FROM (
+        SELECT 1 FROM {RAG_TABLE} {SEARCH_FILTER} LIMIT %s
+    ) f
+"""
+
+# Disk cache vectors are stored little-endian as fp16 for halfvec columns (the
+# column keeps no more precision than that) and as fp32 otherwise
+_DISK_CACHE_FORMATS = {'vector': 'f', 'halfvec': 'e'}
+
+def embedding_cache_key(query: str) -> bytes:
+    """Fixed-size cache key for a query embedded by EMBED_MODEL"""
+    return hashlib.blake2b(EMBED_MODEL.encode('utf-8') + b'\0' + query.encode('utf-8'), digest_size=16).digest()
+
+def get_disk_cache() -> Optional[sqlite3.Connection]:
+    """Return the on-disk embedding cache, opening it on first call (None if disabled or unavailable)
+    The connection may be used from any thread; callers that share it across
+    threads serialize their calls.
+    """
+    global _disk_cache, _disk_cache_opened
+    if not _disk_cache_opened:
+        _disk_cache_opened = True
+        if EMBED_DISK_CACHE:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(EMBED_DISK_CACHE)), exist_ok=True)
+                db = sqlite3.connect(EMBED_DISK_CACHE, isolation_level=None, check_same_thread=False)
+                db.execute("PRAGMA synchronous = OFF")  # a lost entry is just re-embedded
+                db.execute("CREATE TABLE IF NOT EXISTS embed_cache (hash BLOB PRIMARY KEY, model TEXT, dim INT, vec BLOB)")
+                _disk_cache = db
+            except (OSError, sqlite3.Error) as e:
+                print(f"  ⚠ Embedding disk cache disabled: {e}")
+    return _disk_cache
+
+def read_disk_cache(key: bytes) -> Optional[tuple]:
+    """Load an embedding from the disk cache, or None on a miss"""
+    db = get_disk_cache()
+    if db is None:
+        return None
+    try:
+        row = db.execute("SELECT dim, vec FROM embed_cache WHERE hash = ?", (key,)).fetchone()
+    except sqlite3.Error:
+        return None
+    if row is None or row[0] != 384 or not isinstance(row[1], bytes):
+        return None  # miss, or an unusable entry written by an older version
+    dim, vec = row
+    if len(vec) == 2 * dim:
+        fmt = 'e'
+    elif len(vec) == 4 * dim:
+        fmt = 'f'
+    else:
+        return None  # truncated or corrupt entry: re-embed the query
+    return struct.unpack(f"<{dim}{fmt}", vec)
+
+def write_disk_cache(key: bytes, embedding: tuple):
+    """Store an embedding in the disk cache (best effort)"""
+    db = get_disk_cache()
+    if db is None:
+        return
+    vec = struct.pack(f"<{len(embedding)}{_DISK_CACHE_FORMATS[EMBEDDING_TYPE]}", *embedding)
+    try:
+        db.execute("INSERT OR REPLACE INTO embed_cache VALUES (?, ?, ?, ?)",
+                   (key, EMBED_MODEL, len(embedding), vec))
+    except sqlite3.Error:
+        pass
+
+# Significant digits that survive a round trip through each storage type
+_EMBEDDING_DIGITS = {'vector': 7, 'halfvec': 5}
+
+@lru_cache(maxsize=None)
+def _vector_template(dim: int, digits: int) -> str:
+    """%-format template "[%.<digits>g,...]" for a vector of the given dimension"""
+    return "[" + ",".join([f"%.{digits}g"] * dim) + "]"
+
+def format_embedding(embedding) -> str:
+    """Format an embedding as a pgvector literal with only the digits EMBEDDING_TYPE keeps"""
+    return _vector_template(len(embedding), _EMBEDDING_DIGITS[EMBEDDING_TYPE]) % tuple(embedding)
+
+def _field(ctx, name: str):
+    """A retrieved document's field: test_rag_query.py passes dicts, test_rag_simple.py Documents"""
+    return ctx[name] if isinstance(ctx, dict) else getattr(ctx, name)
+
+def dedup_contexts(contexts: Sequence) -> list:
+    """Drop retrieved documents that repeat an earlier (more relevant) one
+    Documents are compared by a blake2b hash of the first 512 characters of their content.
+    """
+    seen = set()
+    unique = []
+    for ctx in contexts:
+        key = hashlib.blake2b(_field(ctx, 'content')[:512].encode('utf-8'), digest_size=16).digest()
+        if key not in seen:
+            seen.add(key)
+            unique.append(ctx)
+    return unique
+
+def build_context_text(contexts: Sequence) -> tuple[str, int]:
+    """Concatenate retrieved documents into the LLM context
+    Each document is written as a "[source_type - component]" header line and its
+    content (cut to MAX_CTX_CHARS), separated by blank lines. Documents that would
+    push the total past MAX_PROMPT_CHARS are left out; the first one is always kept.
+    Returns: (context_text, length in characters)
+    """
+    buf = io.StringIO()
+    ctx_len = 0
+    for i, ctx in enumerate(contexts):
+        separator = "\n\n" if i else ""
+        header = f"[{_field(ctx, 'source_type')} - {_field(ctx, 'component')}]\n"
+        content = _field(ctx, 'content')
+        if len(content) > MAX_CTX_CHARS:
+            content = content[:MAX_CTX_CHARS] + "..."
+        if i and ctx_len + len(separator) + len(header) + len(content) > MAX_PROMPT_CHARS:
+            break
+        ctx_len += buf.write(separator)
+        ctx_len += buf.write(header)
+        ctx_len += buf.write(content)
+    return buf.getvalue(), ctx_len
+
+def format_json(value, indent: int) -> str:
+    """JSON for display: indented on a terminal, a single compact line when output is piped"""
+    return json.dumps(value, indent=indent if sys.stdout.isatty() else None)
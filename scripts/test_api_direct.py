@@ -5,11 +5,22 @@ Useful for debugging API connection issues
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import sys
 import os
 
 GENERATE_API_URL = os.environ.get('GENERATE_API_URL', 'http://localhost:8083/api/rag')
 
+# Shared HTTP session: pools and keeps alive connections to the Phi-4 server
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+_session.mount('http://', _adapter)
+_session.mount('https://', _adapter)
+
+def get_session() -> requests.Session:
+    """Return the shared HTTP session used for all Phi-4 API calls"""
+    return _session
+
 def test_rag_api():
     """Test RAG API directly"""
     print("=" * 80)
@@ -30,7 +41,7 @@ def test_rag_api():
         import time
         start = time.time()
         
-        response = requests.post(
+        response = _session.post(
             GENERATE_API_URL,
             json={
                 "query": test_query,
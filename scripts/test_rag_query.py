@@ -4,17 +4,31 @@ Robust RAG Query Test - Full flow with progress, error handling, and detailed lo
 Retrieves documents from Yugabyte and generates answer using Phi-4 LLM
 """
 
-import requests
-import psycopg2
+import asyncio
 import json
 import os
 import sys
 import time
 import threading
-from typing import List, Dict, Optional
+from collections import OrderedDict
+from typing import TYPE_CHECKING, List, Dict, Optional
+
+# requests and psycopg2 are imported where first used, so the usage message
+# and other early exits do not pay for loading them
+if TYPE_CHECKING:
+    import psycopg2.pool
+    import requests
+
+from rag_common import (
+    BRUTE_FORCE_THRESHOLD, COUNT_FILTERED_SQL, EMBEDDING_TYPE, RAG_TABLE, SEARCH_FILTER,
+    build_context_text, dedup_contexts, embedding_cache_key, format_embedding, format_json,
+    read_disk_cache, write_disk_cache,
+)
 
 # Configuration with defaults
 EMBED_API_URL = os.environ.get('EMBED_API_URL', 'http://localhost:8083/api/embed')
+EMBED_BATCH_URL = os.environ.get('EMBED_BATCH_URL', EMBED_API_URL.replace('/api/embed', '/api/embed_batch'))
+EMBED_BATCH_SIZE = int(os.environ.get('EMBED_BATCH_SIZE', '32'))  # questions per batch request
 GENERATE_API_URL = os.environ.get('GENERATE_API_URL', 'http://localhost:8083/api/rag')
 DB_CONFIG = {
     'dbname': os.environ.get('DB_NAME', 'postgres'),
@@ -24,76 +38,280 @@ DB_CONFIG = {
     'port': int(os.environ.get('DB_PORT', '5433'))
 }
 
+# Database connections kept open for reuse across searches (one per concurrent query)
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '8'))
+
+# HNSW search breadth (pgvector default 40): candidates kept while walking the
+# graph. Higher improves recall at some latency cost; it must be >= top_k.
+EF_SEARCH = int(os.environ.get('HNSW_EF_SEARCH', '40'))
+# Set HNSW_FORCE_INDEX=1 to disable sequential scans for the search (useful
+# when planner statistics are stale and it wrongly skips the HNSW index)
+FORCE_INDEX = os.environ.get('HNSW_FORCE_INDEX', '0') == '1'
+
 # Timeout configuration
 EMBED_TIMEOUT = 120  # 2 minutes for embedding
 RAG_TIMEOUT = 600    # 10 minutes for RAG generation (CPU is slow)
+HEALTH_TIMEOUT = 2   # seconds per pre-flight probe (services are local)
 MAX_TOKENS = 100     # Reduced for faster CPU inference
 
+# Ask the RAG API to stream tokens (SSE or JSON lines) so the answer is printed
+# as it is generated; servers that ignore "stream" answer with plain JSON as before
+RAG_STREAM = os.environ.get('RAG_STREAM', '1') == '1'
+_STREAM_TYPES = ('text/event-stream', 'application/x-ndjson', 'application/jsonl')
+
+# In-process LRU cache of query embeddings, keyed by a hash of the query text
+EMBED_CACHE_SIZE = 1024
+_embedding_cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+_embedding_cache_lock = threading.Lock()
+
+# Shared HTTP session: pools and keeps alive connections to the Phi-4 server
+_session: Optional["requests.Session"] = None
+_session_lock = threading.Lock()
+
+def get_session() -> "requests.Session":
+    """Return the shared HTTP session used for all Phi-4 API calls, creating it on first call"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+# Shared database connection pool, created on first use
+_pool: Optional["psycopg2.pool.ThreadedConnectionPool"] = None
+_pool_lock = threading.Lock()
+_configured_conns = set()  # pooled connections whose session settings are applied
+_exact_search: Optional[bool] = None  # search strategy, decided on first connection
+
+def get_pool() -> "psycopg2.pool.ThreadedConnectionPool":
+    """Return the shared connection pool, connecting on first call"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            import psycopg2.pool
+            _pool = psycopg2.pool.ThreadedConnectionPool(1, DB_POOL_MAX, **DB_CONFIG)
+        return _pool
+
+# Vector similarity search, prepared once per pooled connection as rag_search
+# (query vector, top_k). The raw cosine distance is returned; similarity
+# (1 - distance) is derived in Python. The top-K search works on (id, distance)
+# only; the wide columns (content, metadata) are fetched for just those K rows.
+# {top} is one of the two top-K strategies below.
+_PREPARE_SEARCH_SQL = f"""
+    PREPARE rag_search ({EMBEDDING_TYPE}, int) AS
+    WITH top AS ({{top}})
+    SELECT r.source_type, r.component, r.source_name, r.content, r.metadata, r.event_date, t.distance
+    FROM top t JOIN {RAG_TABLE} r USING (id)
+    ORDER BY t.distance
+"""
+
+# Approximate top-K: walk the HNSW index
+_HNSW_TOP_SQL = f"""
+        SELECT id, embedding <=> $1 AS distance
+        FROM {RAG_TABLE}
+        {SEARCH_FILTER}
+        ORDER BY embedding <=> $1
+        LIMIT $2
+"""
+
+# Exact top-K: distance to every filtered row, then a top-N sort. OFFSET 0
+# keeps the subquery from being flattened, so the ORDER BY cannot use HNSW.
+_EXACT_TOP_SQL = f"""
+        SELECT id, distance
+        FROM (
+            SELECT id, embedding <=> $1 AS distance
+            FROM {RAG_TABLE}
+            {SEARCH_FILTER}
+            OFFSET 0
+        ) f
+        ORDER BY distance
+        LIMIT $2
+"""
+
+def use_exact_search(cur) -> bool:
+    """True when fewer than BRUTE_FORCE_THRESHOLD rows match the search filter
+    Counted once per run; every pooled connection prepares the same strategy.
+    """
+    global _exact_search
+    if _exact_search is None:
+        cur.execute(COUNT_FILTERED_SQL, (BRUTE_FORCE_THRESHOLD,))
+        _exact_search = cur.fetchone()[0] < BRUTE_FORCE_THRESHOLD
+    return _exact_search
+
+def configure_connection(conn):
+    """Apply session settings to a pooled connection the first time it is checked out
+    and prepare the rag_search statement, so each search skips parse and plan.
+    """
+    if conn in _configured_conns:
+        return
+    import psycopg2
+    # Plain SELECTs need no BEGIN/COMMIT round trips
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("SET hnsw.ef_search = %s", (EF_SEARCH,))
+        if FORCE_INDEX:
+            cur.execute("SET enable_seqscan = off")
+        try:
+            # Reuse the one generic plan (an HNSW index scan) for every EXECUTE
+            cur.execute("SET plan_cache_mode = force_generic_plan")
+        except psycopg2.Error:
+            pass  # no plan_cache_mode before PostgreSQL 12; the server picks generic plans itself
+        top_sql = _EXACT_TOP_SQL if use_exact_search(cur) else _HNSW_TOP_SQL
+        cur.execute(_PREPARE_SEARCH_SQL.format(top=top_sql))
+    _configured_conns.add(conn)
+
+def close_pool():
+    """Close all pooled database connections"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _configured_conns.clear()
+
+# Progress animation: drawn on stderr, only when it is a terminal and NO_PROGRESS
+# is unset, so piped output and CI logs get no carriage-return noise
+PROGRESS_TICK = 1.0  # seconds between animation frames
+
+def progress_enabled() -> bool:
+    """True if progress animations should be drawn"""
+    return sys.stderr.isatty() and not os.environ.get('NO_PROGRESS')
+
 class ProgressIndicator:
-    """Thread-safe progress indicator"""
+    """Thread-safe progress indicator
+    When enabled (see progress_enabled), a background thread animates the
+    message on stderr; otherwise start() and stop() do nothing.
+    """
     def __init__(self, message="Processing"):
         self.message = message
-        self.stop_event = threading.Event()
+        self.enabled = progress_enabled()
+        self.stop_event = threading.Event() if self.enabled else None
         self.thread = None
         
     def start(self):
         """Start showing progress"""
+        if not self.enabled:
+            return
         self.stop_event.clear()
         self.thread = threading.Thread(target=self._show_progress, daemon=True)
         self.thread.start()
         
     def stop(self):
         """Stop showing progress"""
+        if not self.enabled or self.thread is None:
+            return
         self.stop_event.set()
-        if self.thread:
-            self.thread.join(timeout=1)
-        print()  # New line after progress
+        self.thread.join(timeout=1)
+        self.thread = None
+        sys.stderr.write('\n')  # New line after progress
+        sys.stderr.flush()
         
     def _show_progress(self):
-        """Show animated progress dots"""
+        """Show animated progress dots, one write per frame"""
         dots = 0
         while not self.stop_event.is_set():
-            animation = ['...', '..', '.'][dots % 3]
-            print(f"\r  {self.message}{animation}", end='', flush=True)
-            time.sleep(0.5)
+            sys.stderr.write('\r  ' + self.message + ['...', '..', '.'][dots % 3])
+            sys.stderr.flush()
+            self.stop_event.wait(PROGRESS_TICK)
             dots += 1
 
-def check_health() -> Dict[str, bool]:
-    """Check health of all services"""
-    health = {
-        'phi4': False,
-        'yugabyte': False
-    }
-    
-    # Check Phi-4
+async def ticker(message: str):
+    """Progress indicator for async code: animated dots on the event loop until the task is cancelled"""
+    if not progress_enabled():
+        return
+    dots = 0
+    try:
+        while True:
+            sys.stderr.write('\r  ' + message + ['...', '..', '.'][dots % 3])
+            sys.stderr.flush()
+            await asyncio.sleep(PROGRESS_TICK)
+            dots += 1
+    finally:
+        sys.stderr.write('\n')  # New line after progress
+        sys.stderr.flush()
+
+def _probe_phi4() -> bool:
+    """Return True if the Phi-4 health endpoint answers 200"""
     try:
         health_url = EMBED_API_URL.replace('/api/embed', '/health')
-        response = requests.get(health_url, timeout=5)
-        health['phi4'] = response.status_code == 200
+        response = get_session().get(health_url, timeout=HEALTH_TIMEOUT)
+        return response.status_code == 200
     except:
-        pass
-    
-    # Check Yugabyte
+        return False
+
+def _probe_yugabyte() -> bool:
+    """Return True if a database connection opens within HEALTH_TIMEOUT
+    A separate connection, so the short timeout does not apply to the pool used for searches.
+    """
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        conn.close()
-        health['yugabyte'] = True
+        import psycopg2
+        psycopg2.connect(connect_timeout=HEALTH_TIMEOUT, **DB_CONFIG).close()
+        return True
     except:
-        pass
-    
-    return health
+        return False
+
+async def check_health() -> Dict[str, bool]:
+    """Check health of all services (both probes run concurrently)"""
+    phi4, yugabyte = await asyncio.gather(
+        asyncio.to_thread(_probe_phi4),
+        asyncio.to_thread(_probe_yugabyte)
+    )
+    return {
+        'phi4': phi4,
+        'yugabyte': yugabyte
+    }
+
+def _remember_embedding(key: bytes, embedding: tuple):
+    """Add an embedding to the in-process cache, evicting the least recently used entry if full"""
+    _embedding_cache[key] = embedding
+    if len(_embedding_cache) > EMBED_CACHE_SIZE:
+        _embedding_cache.popitem(last=False)
 
-def embed_query(query: str) -> tuple[List[float], float]:
+def get_cached_embedding(query: str) -> Optional[tuple]:
+    """Return the cached embedding for query (in-process, then on disk), or None on a cache miss"""
+    key = embedding_cache_key(query)
+    with _embedding_cache_lock:
+        embedding = _embedding_cache.get(key)
+        if embedding is not None:
+            _embedding_cache.move_to_end(key)
+            return embedding
+        embedding = read_disk_cache(key)
+        if embedding is not None:
+            _remember_embedding(key, embedding)
+        return embedding
+
+def cache_embedding(query: str, embedding: List[float]) -> tuple:
+    """Store an embedding in the in-process and disk caches"""
+    embedding = tuple(embedding)
+    key = embedding_cache_key(query)
+    with _embedding_cache_lock:
+        _remember_embedding(key, embedding)
+        write_disk_cache(key, embedding)
+    return embedding
+
+def embed_query(query: str) -> tuple[tuple, float]:
     """Generate embedding for query with progress and error handling
+    Repeated queries are served from the in-process or disk cache with a latency of 0.
     Returns: (embedding, latency_seconds)
     """
+    embedding = get_cached_embedding(query)
+    if embedding is not None:
+        print(f"  ✓ Embedding loaded from cache ({len(embedding)} dimensions)")
+        return embedding, 0.0
+    
+    import requests
     print(f"  Generating embedding for query...")
     progress = ProgressIndicator("Generating embedding")
     progress.start()
     
     start_time = time.time()
     try:
-        response = requests.post(
+        response = get_session().post(
             EMBED_API_URL,
             json={"text": query},
             timeout=EMBED_TIMEOUT
@@ -109,7 +327,7 @@ def embed_query(query: str) -> tuple[List[float], float]:
             raise ValueError(f"Expected 384 dimensions, got {len(embedding)}")
         
         print(f"  ✓ Embedding generated ({len(embedding)} dimensions) - {elapsed:.3f}s")
-        return embedding, elapsed
+        return cache_embedding(query, embedding), elapsed
         
     except requests.exceptions.Timeout:
         elapsed = time.time() - start_time
@@ -124,86 +342,222 @@ def embed_query(query: str) -> tuple[List[float], float]:
         progress.stop()
         raise Exception(f"Embedding error after {elapsed:.1f}s: {str(e)}")
 
-def retrieve_context(query: str, top_k: int = 6) -> tuple[List[Dict], Dict[str, float]]:
-    """Retrieve relevant documents from Yugabyte with progress
-    Returns: (results, timing_dict) where timing_dict contains 'embedding', 'db_query', 'total'
+def embed_queries(queries: List[str]) -> tuple[List[tuple], float]:
+    """Generate embeddings for several queries, reusing cached embeddings
+    Only cache misses are sent to the API (see _embed_batch).
+    Returns: (embeddings, latency_seconds)
     """
-    print(f"  Retrieving documents from Yugabyte...")
-    progress = ProgressIndicator("Searching vector database")
-    progress.start()
+    embeddings = [get_cached_embedding(query) for query in queries]
+    missing = list(dict.fromkeys(query for query, embedding in zip(queries, embeddings) if embedding is None))
+    if not missing:
+        print(f"  ✓ {len(embeddings)} embeddings loaded from cache")
+        return embeddings, 0.0
     
-    retrieval_start = time.time()
-    timing = {}
+    if len(missing) == 1:
+        embedding, elapsed = embed_query(missing[0])
+        fresh = {missing[0]: embedding}
+    else:
+        batch, elapsed = _embed_batch(missing)
+        fresh = dict(zip(missing, batch))
+    return [fresh[query] if embedding is None else embedding for query, embedding in zip(queries, embeddings)], elapsed
+
+def _embed_batch(queries: List[str]) -> tuple[List[tuple], float]:
+    """Generate embeddings for several queries with one batch call per EMBED_BATCH_SIZE queries
+    Falls back to one embed_query call per query if the server has no batch endpoint.
+    Returns: (embeddings, latency_seconds)
+    """
+    import requests
+    print(f"  Generating embeddings for {len(queries)} queries...")
+    progress = ProgressIndicator("Generating embeddings")
+    progress.start()
     
+    start_time = time.time()
+    embeddings = []
     try:
-        # Generate query embedding
-        query_embedding, embed_latency = embed_query(query)
-        timing['embedding'] = embed_latency
-        
-        # Connect to database and query
-        db_start = time.time()
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
+        for start in range(0, len(queries), EMBED_BATCH_SIZE):
+            chunk = queries[start:start + EMBED_BATCH_SIZE]
+            response = get_session().post(
+                EMBED_BATCH_URL,
+                json={"texts": chunk},
+                timeout=EMBED_TIMEOUT
+            )
+            if response.status_code in (404, 405):
+                progress.stop()
+                print(f"  ⚠ Batch endpoint not available ({response.status_code}), embedding one query at a time")
+                embeddings.extend(embed_query(query)[0] for query in queries[start:])
+                return embeddings, time.time() - start_time
+            response.raise_for_status()
+            batch = response.json().get('embeddings', [])
+            
+            if len(batch) != len(chunk) or any(len(embedding) != 384 for embedding in batch):
+                raise ValueError(f"Expected {len(chunk)} embeddings of 384 dimensions")
+            embeddings.extend(cache_embedding(query, embedding) for query, embedding in zip(chunk, batch))
         
-        # Format embedding as PostgreSQL vector string
-        embedding_str = '[' + ','.join(map(str, query_embedding)) + ']'
-        
-        # Vector similarity search
-        cur.execute("""
-            SELECT source_type, component, source_name, content, metadata, event_date,
-                   1 - (embedding <=> %s::vector) as similarity
-            FROM rag_documents
-            WHERE table_name = 'dda_transactions'
-            ORDER BY embedding <=> %s::vector
-            LIMIT %s
-        """, (embedding_str, embedding_str, top_k))
-        
-        results = []
-        for row in cur.fetchall():
-            results.append({
-                'source_type': row[0],
-                'component': row[1],
-                'source_name': row[2],
-                'content': row[3],
-                'metadata': row[4] if row[4] else {},
-                'event_date': str(row[5]) if row[5] else None,
-                'similarity': float(row[6]) if row[6] else None
-            })
+        elapsed = time.time() - start_time
+        progress.stop()
+        print(f"  ✓ {len(embeddings)} embeddings generated - {elapsed:.3f}s")
+        return embeddings, elapsed
         
-        cur.close()
-        conn.close()
-        db_latency = time.time() - db_start
-        timing['db_query'] = db_latency
+    except requests.exceptions.Timeout:
+        elapsed = time.time() - start_time
+        progress.stop()
+        raise Exception(f"Embedding API timeout after {elapsed:.1f}s (>{EMBED_TIMEOUT}s). Check if Phi-4 is running.")
+    except requests.exceptions.ConnectionError:
+        elapsed = time.time() - start_time
+        progress.stop()
+        raise Exception(f"Cannot connect to embedding API at {EMBED_BATCH_URL}. Check if Phi-4 container is running.")
+    except Exception as e:
+        elapsed = time.time() - start_time
+        progress.stop()
+        raise Exception(f"Embedding error after {elapsed:.1f}s: {str(e)}")
+
+def search_documents(query_embedding: tuple, top_k: int = 6) -> tuple[List[Dict], float]:
+    """Run the vector similarity search for one query embedding
+    Returns: (results, latency_seconds)
+    """
+    db_start = time.time()
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        configure_connection(conn)
+        with conn.cursor() as cur:
+            results = _search(cur, query_embedding, top_k)
+    finally:
+        pool.putconn(conn)
+    return results, time.time() - db_start
+
+def _search(cur, query_embedding: tuple, top_k: int) -> List[Dict]:
+    """Execute the similarity SELECT on cur and return the result rows as dicts"""
+    # Format embedding as PostgreSQL vector string
+    embedding_str = format_embedding(query_embedding)
+    
+    cur.execute("EXECUTE rag_search (%s, %s)", (embedding_str, top_k))
+    
+    results = []
+    for source_type, component, source_name, content, metadata, event_date, distance in cur:
+        results.append({
+            'source_type': source_type,
+            'component': component,
+            'source_name': source_name,
+            'content': content,
+            'metadata': metadata or {},
+            'event_date': None if event_date is None else event_date.isoformat(),
+            'similarity': None if distance is None else 1.0 - distance
+        })
+    return results
+
+async def retrieve_context(queries: List[str], top_k: int = 6) -> List[tuple[List[Dict], Dict[str, float]]]:
+    """Retrieve relevant documents from Yugabyte for each query with progress
+    All queries are embedded together (embed_queries), then the vector searches run concurrently.
+    Returns: one (results, timing_dict) per query, where timing_dict contains 'embedding', 'db_query', 'total'
+    """
+    import psycopg2
+    print(f"  Retrieving documents from Yugabyte...")
+    progress = asyncio.create_task(ticker("Searching vector database"))
+    
+    retrieval_start = time.time()
+    
+    try:
+        # Generate query embeddings
+        query_embeddings, embed_latency = await asyncio.to_thread(embed_queries, queries)
         
-        total_retrieval = time.time() - retrieval_start
-        timing['total'] = total_retrieval
+        # Search for all queries concurrently, one pooled connection each; at
+        # most DB_POOL_MAX at a time so the pool is never exhausted
+        db_slots = asyncio.Semaphore(DB_POOL_MAX)
         
-        progress.stop()
+        async def search(embedding: tuple) -> tuple[List[Dict], float]:
+            async with db_slots:
+                return await asyncio.to_thread(search_documents, embedding, top_k)
         
-        print(f"  ✓ Found {len(results)} relevant documents")
-        print(f"  ⏱  Timing: Embedding={timing['embedding']:.3f}s, DB Query={timing['db_query']:.3f}s, Total={timing['total']:.3f}s")
-        return results, timing
+        searches = await asyncio.gather(*(search(embedding) for embedding in query_embeddings))
         
     except psycopg2.OperationalError as e:
         elapsed = time.time() - retrieval_start
-        progress.stop()
         raise Exception(f"Database connection error after {elapsed:.1f}s: {str(e)}. Check if Yugabyte is running and DB_NAME=postgres")
     except Exception as e:
         elapsed = time.time() - retrieval_start
-        progress.stop()
         raise Exception(f"Retrieval error after {elapsed:.1f}s: {str(e)}")
+    finally:
+        progress.cancel()
+        await asyncio.wait([progress])
+    
+    retrievals = []
+    for results, db_latency in searches:
+        timing = {
+            'embedding': embed_latency,
+            'db_query': db_latency,
+            'total': embed_latency + db_latency
+        }
+        print(f"  ✓ Found {len(results)} relevant documents")
+        print(f"  ⏱  Timing: Embedding={timing['embedding']:.3f}s, DB Query={timing['db_query']:.3f}s, Total={timing['total']:.3f}s")
+        retrievals.append((results, timing))
+    return retrievals
+
+def _stream_answer(response: "requests.Response", progress: ProgressIndicator, start_time: float) -> str:
+    """Print answer tokens as they arrive from a streaming RAG response and return the full answer
+    Accepts SSE ("data: {...}" events, optional "data: [DONE]") or one JSON object per line;
+    each chunk carries its text in 'text' (or 'token'). An SSE data payload that is not a
+    JSON object is the token text itself. If the stream breaks after tokens have arrived, the partial answer
+    is returned with a note instead of an error.
+    """
+    import requests
+    sse = response.headers.get('Content-Type', '').startswith('text/event-stream')
+    parts = []
+    try:
+        for line in response.iter_lines():
+            line = line.decode('utf-8')
+            if sse:
+                if not line.startswith('data:'):
+                    continue
+                line = line[6:] if line.startswith('data: ') else line[5:]
+                if line.strip() == '[DONE]':
+                    break
+                if not line:
+                    continue
+            elif not line.strip():
+                continue
+            try:
+                chunk = json.loads(line)
+            except ValueError:
+                if not sse:
+                    raise
+                chunk = None
+            if isinstance(chunk, dict):
+                token = chunk.get('text') or chunk.get('token') or ''
+            elif sse:
+                token = line  # plain-text SSE payload, kept verbatim (even "true", "42" or spaces)
+            else:
+                continue
+            if not token:
+                continue
+            if not parts:
+                progress.stop()
+                print(f"  ✓ First token after {time.time() - start_time:.3f}s")
+                print("  ", end='')
+            print(token, end='', flush=True)
+            parts.append(token)
+    except requests.exceptions.RequestException as e:
+        if not parts:
+            raise
+        reason = 'timed out' if isinstance(e, requests.exceptions.Timeout) or 'timed out' in str(e) else 'was interrupted'
+        print(f"\n  ⚠ Stream {reason} after {time.time() - start_time:.1f}s; keeping the partial answer")
+        return ''.join(parts) + f"\n\n[Answer incomplete: the stream {reason}]"
+    if parts:
+        print()
+    else:
+        progress.stop()
+    return ''.join(parts)
 
 def generate_answer(query: str, contexts: List[Dict]) -> tuple[str, float]:
     """Generate answer using RAG with progress, timeout, and error handling
     Returns: (answer, latency_seconds)
     """
+    import requests
+    
     # Combine contexts
-    context_text = "\n\n".join([
-        f"[{ctx['source_type']} - {ctx['component']}]\n{ctx['content']}" 
-        for ctx in contexts
-    ])
+    context_text, ctx_len = build_context_text(contexts)
     
-    print(f"  Context prepared: {len(context_text)} characters from {len(contexts)} documents")
+    print(f"  Context prepared: {ctx_len} characters from {len(contexts)} documents")
     print(f"  Calling Phi-4 RAG API at: {GENERATE_API_URL}")
     print(f"  ⏱  This may take 2-5 minutes on CPU (please wait)...")
     print(f"  📊 Request: max_tokens={MAX_TOKENS}, temperature=0.3")
@@ -214,17 +568,30 @@ def generate_answer(query: str, contexts: List[Dict]) -> tuple[str, float]:
     start_time = time.time()
     
     try:
-        response = requests.post(
+        payload = {
+            "query": query,
+            "context": context_text,
+            "max_tokens": MAX_TOKENS,
+            "temperature": 0.3
+        }
+        if RAG_STREAM:
+            payload["stream"] = True
+        response = get_session().post(
             GENERATE_API_URL,
-            json={
-                "query": query,
-                "context": context_text,
-                "max_tokens": MAX_TOKENS,
-                "temperature": 0.3
-            },
-            timeout=RAG_TIMEOUT
+            json=payload,
+            timeout=RAG_TIMEOUT,
+            stream=RAG_STREAM
         )
         
+        if response.ok and response.headers.get('Content-Type', '').startswith(_STREAM_TYPES):
+            answer = _stream_answer(response, progress, start_time)
+            elapsed = time.time() - start_time
+            print(f"  ✓ Answer streamed in {elapsed:.3f}s ({elapsed/60:.2f} minutes)")
+            if not answer.strip():
+                print(f"  ⚠ Warning: Empty answer in response")
+                return "Error: Empty answer received from API. Check Phi-4 container logs.", elapsed
+            return answer.strip(), elapsed
+        
         elapsed = time.time() - start_time
         progress.stop()
         
@@ -239,7 +606,7 @@ def generate_answer(query: str, contexts: List[Dict]) -> tuple[str, float]:
         
         if not answer or answer.strip() == "":
             print(f"  ⚠ Warning: Empty answer in response")
-            print(f"  Response JSON: {json.dumps(result, indent=2)}")
+            print(f"  Response JSON: {format_json(result, indent=2)}")
             return "Error: Empty answer received from API. Check Phi-4 container logs.", elapsed
         
         if status != 'success':
@@ -283,29 +650,22 @@ def generate_answer(query: str, contexts: List[Dict]) -> tuple[str, float]:
         traceback.print_exc()
         return f"Error: {str(e)}", elapsed
 
-def main():
-    """Main function with full error handling and progress tracking"""
-    if len(sys.argv) < 2:
-        print("Usage: python test_rag_query.py '<your question>'")
-        print("\nExample questions:")
-        print("  - What is the schema of dda_transactions?")
-        print("  - Why was dda_transactions delayed yesterday?")
-        print("  - What caused Kafka lag?")
-        print("  - Which component was the bottleneck?")
-        sys.exit(1)
-    
-    query = sys.argv[1]
-    
+async def run_queries(queries: List[str]):
+    """Run the full RAG flow for one or more questions
+    All questions are embedded in one batch call and searched concurrently;
+    answers are then generated one question at a time.
+    """
     print("=" * 80)
     print("RAG Query Test - Full Flow")
     print("=" * 80)
-    print(f"\nQuestion: {query}")
+    for query in queries:
+        print(f"\nQuestion: {query}")
     print()
     
     # Pre-flight checks
     print("Pre-flight Checks:")
     print("-" * 80)
-    health = check_health()
+    health = await check_health()
     
     if not health['phi4']:
         print("  ✗ Phi-4 API: NOT AVAILABLE")
@@ -325,35 +685,46 @@ def main():
     
     print()
     
-    # Track total time
-    total_start_time = time.time()
-    
     # Step 1: Retrieve context
     print("=" * 80)
     print("Step 1: Retrieving Relevant Documents")
     print("=" * 80)
-    retrieval_timing = {}
     try:
-        contexts, retrieval_timing = retrieve_context(query, top_k=6)
+        retrievals = await retrieve_context(queries, top_k=6)
         print()
-        
-        if not contexts:
-            print("  ⚠ No documents found!")
-            print("  Check if data was loaded: SELECT COUNT(*) FROM rag_documents;")
-            sys.exit(1)
-        
-        # Show retrieved documents summary
-        print("Retrieved Documents Summary:")
-        for i, ctx in enumerate(contexts, 1):
-            similarity = ctx.get('similarity', 0)
-            print(f"  [{i}] {ctx['source_type']} - {ctx['component']} "
-                  f"(similarity: {similarity:.3f})")
-        print()
-        
     except Exception as e:
         print(f"\n✗ Step 1 Failed: {e}")
         sys.exit(1)
     
+    for query, (contexts, retrieval_timing) in zip(queries, retrievals):
+        if len(queries) > 1:
+            print("=" * 80)
+            print(f"Question: {query}")
+        answer_query(query, contexts, retrieval_timing)
+
+def answer_query(query: str, contexts: List[Dict], retrieval_timing: Dict[str, float]):
+    """Generate and display the answer for one question from its retrieved contexts"""
+    # Track total time (retrieval already happened)
+    step2_start_time = time.time()
+    
+    if not contexts:
+        print("  ⚠ No documents found!")
+        print("  Check if data was loaded: SELECT COUNT(*) FROM rag_documents;")
+        sys.exit(1)
+    
+    unique = dedup_contexts(contexts)
+    if len(unique) < len(contexts):
+        print(f"  Removed {len(contexts) - len(unique)} duplicate documents")
+    contexts = unique
+    
+    # Show retrieved documents summary
+    print("Retrieved Documents Summary:")
+    for i, ctx in enumerate(contexts, 1):
+        similarity = ctx.get('similarity', 0)
+        print(f"  [{i}] {ctx['source_type']} - {ctx['component']} "
+              f"(similarity: {similarity:.3f})")
+    print()
+    
     # Step 2: Generate answer
     print("=" * 80)
     print("Step 2: Generating Answer with Phi-4 LLM")
@@ -368,7 +739,7 @@ def main():
         sys.exit(1)
     
     # Calculate total time
-    total_elapsed = time.time() - total_start_time
+    total_elapsed = retrieval_timing.get('total', 0) + (time.time() - step2_start_time)
     
     # Display results
     print("=" * 80)
@@ -391,7 +762,7 @@ def main():
             print(f"    Relevance: {ctx['similarity']:.1%}")
         print(f"    Content: {ctx['content'][:300]}...")
         if ctx.get('metadata'):
-            print(f"    Metadata: {json.dumps(ctx['metadata'], indent=6)}")
+            print(f"    Metadata: {format_json(ctx['metadata'], indent=6)}")
     
     # Display latency summary
     print("\n" + "=" * 80)
@@ -409,6 +780,22 @@ def main():
     print("✓ Query completed successfully!")
     print("=" * 80)
 
+def main():
+    """Main function with full error handling and progress tracking"""
+    if len(sys.argv) < 2:
+        print("Usage: python test_rag_query.py '<your question>' ['<another question>' ...]")
+        print("\nExample questions:")
+        print("  - What is the schema of dda_transactions?")
+        print("  - Why was dda_transactions delayed yesterday?")
+        print("  - What caused Kafka lag?")
+        print("  - Which component was the bottleneck?")
+        sys.exit(1)
+    
+    try:
+        asyncio.run(run_queries(sys.argv[1:]))
+    finally:
+        close_pool()
+
 if __name__ == "__main__":
     try:
         main()
@@ -4,11 +4,21 @@ Simplified RAG test - Just test retrieval and show what would be sent to LLM
 Useful for debugging when LLM generation is slow
 """
 
-import requests
-import psycopg2
-import json
 import os
 import sys
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, NamedTuple, Optional
+
+# requests and psycopg2 are imported where first used, so the usage message
+# does not pay for loading them
+if TYPE_CHECKING:
+    import requests
+
+from rag_common import (
+    BRUTE_FORCE_THRESHOLD, COUNT_FILTERED_SQL, EMBEDDING_TYPE, RAG_TABLE, SEARCH_FILTER,
+    build_context_text, dedup_contexts, embedding_cache_key, format_embedding, format_json,
+    read_disk_cache, write_disk_cache,
+)
 
 # Configuration
 EMBED_API_URL = os.environ.get('EMBED_API_URL', 'http://localhost:8083/api/embed')
@@ -20,49 +30,146 @@ DB_CONFIG = {
     'port': int(os.environ.get('DB_PORT', '5433'))
 }
 
-def embed_query(query: str) -> list:
-    """Generate embedding for query"""
+# HNSW search breadth (pgvector default 40): candidates kept while walking the
+# graph. Higher improves recall at some latency cost; it must be >= top_k.
+EF_SEARCH = int(os.environ.get('HNSW_EF_SEARCH', '40'))
+# Set HNSW_FORCE_INDEX=1 to disable sequential scans for the search (useful
+# when planner statistics are stale and it wrongly skips the HNSW index)
+FORCE_INDEX = os.environ.get('HNSW_FORCE_INDEX', '0') == '1'
+
+# Shared HTTP session: pools and keeps alive connections to the Phi-4 server
+_session: Optional["requests.Session"] = None
+
+def get_session() -> "requests.Session":
+    """Return the shared HTTP session used for all Phi-4 API calls, creating it on first call"""
+    global _session
+    if _session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _session = session
+    return _session
+
+
+def embed_query(query: str) -> tuple:
+    """Generate embedding for query (repeated queries are served from an in-process or disk cache)"""
+    hits = _fetch_embedding.cache_info().hits
+    embedding, from_disk = _fetch_embedding(query)
+    if from_disk or _fetch_embedding.cache_info().hits > hits:
+        print(f"  ✓ Embedding loaded from cache ({len(embedding)} dimensions)")
+    else:
+        print(f"  ✓ Embedding generated ({len(embedding)} dimensions)")
+    return embedding
+
+@lru_cache(maxsize=1024)
+def _fetch_embedding(query: str) -> tuple[tuple, bool]:
+    """Look the query up in the disk cache, else call the embedding API
+    Returns: (embedding as a tuple so the result can be cached, loaded from disk)
+    """
+    key = embedding_cache_key(query)
+    embedding = read_disk_cache(key)
+    if embedding is not None:
+        return embedding, True
     print(f"  Generating embedding...")
-    response = requests.post(EMBED_API_URL, json={"text": query}, timeout=60)
+    response = get_session().post(EMBED_API_URL, json={"text": query}, timeout=60)
     response.raise_for_status()
-    embedding = response.json().get('embedding', [])
-    print(f"  ✓ Embedding generated ({len(embedding)} dimensions)")
-    return embedding
+    embedding = tuple(response.json().get('embedding', []))
+    if len(embedding) != 384:
+        raise ValueError(f"Expected 384 dimensions, got {len(embedding)}")
+    write_disk_cache(key, embedding)
+    return embedding, False
 
-def retrieve_context(query: str, top_k: int = 6) -> list:
-    """Retrieve relevant documents from Yugabyte"""
+class Document(NamedTuple):
+    """A retrieved document and its similarity to the query"""
+    source_type: str
+    component: Optional[str]
+    source_name: Optional[str]
+    content: str
+    metadata: Optional[dict]
+    event_date: Optional[str]
+    similarity: Optional[float]
+
+# Vector similarity search; the query vector is sent once and read back
+# through a scalar subquery so the HNSW index can still order by it. The raw
+# cosine distance is returned; similarity (1 - distance) is derived in Python.
+# The top-K search works on (id, distance) only; the wide columns (content,
+# metadata) are fetched for just those K rows. {top} is one of the two
+# top-K strategies below.
+_SEARCH_SQL = f"""
+    WITH q AS (SELECT %s::{EMBEDDING_TYPE} AS v),
+    top AS ({{top}})
+    SELECT r.source_type, r.component, r.source_name, r.content, r.metadata, r.event_date, t.distance
+    FROM top t JOIN {RAG_TABLE} r USING (id)
+    ORDER BY t.distance
+"""
+
+# Approximate top-K: walk the HNSW index
+SEARCH_SQL = _SEARCH_SQL.format(top=f"""
+        SELECT id, embedding <=> (SELECT v FROM q) AS distance
+        FROM {RAG_TABLE}
+        {SEARCH_FILTER}
+        ORDER BY embedding <=> (SELECT v FROM q)
+        LIMIT %s
+""")
+
+# Exact top-K: distance to every filtered row, then a top-N sort. OFFSET 0
+# keeps the subquery from being flattened, so the ORDER BY cannot use HNSW.
+EXACT_SEARCH_SQL = _SEARCH_SQL.format(top=f"""
+        SELECT id, distance
+        FROM (
+            SELECT id, embedding <=> (SELECT v FROM q) AS distance
+            FROM {RAG_TABLE}
+            {SEARCH_FILTER}
+            OFFSET 0
+        ) f
+        ORDER BY distance
+        LIMIT %s
+""")
+
+def retrieve_context(query: str, top_k: int = 6, explain: bool = False) -> List[Document]:
+    """Retrieve relevant documents from Yugabyte
+    explain: print EXPLAIN (ANALYZE, BUFFERS) of the search before running it
+    """
+    import psycopg2
+    
     query_embedding = embed_query(query)
     
     # Connect to database
     print(f"  Connecting to database...")
     conn = psycopg2.connect(**DB_CONFIG)
     cur = conn.cursor()
+    cur.execute("SET LOCAL hnsw.ef_search = %s", (EF_SEARCH,))
+    if FORCE_INDEX:
+        cur.execute("SET LOCAL enable_seqscan = off")
+    
+    # Small filtered sets are searched exactly; HNSW only pays off on large ones
+    cur.execute(COUNT_FILTERED_SQL, (BRUTE_FORCE_THRESHOLD,))
+    exact = cur.fetchone()[0] < BRUTE_FORCE_THRESHOLD
+    search_sql = EXACT_SEARCH_SQL if exact else SEARCH_SQL
     
     # Format embedding as PostgreSQL vector string
-    embedding_str = '[' + ','.join(map(str, query_embedding)) + ']'
+    embedding_str = format_embedding(query_embedding)
     
-    # Vector similarity search
-    print(f"  Searching vector database...")
-    cur.execute("""
-        SELECT source_type, component, source_name, content, metadata, event_date,
-               1 - (embedding <=> %s::vector) as similarity
-        FROM rag_documents
-        WHERE table_name = 'dda_transactions'
-        ORDER BY embedding <=> %s::vector
-        LIMIT %s
-    """, (embedding_str, embedding_str, top_k))
+    if explain:
+        # Show the executed plan: for HNSW expect an Index Scan, not Seq Scan + Sort
+        # (see sql/05_create_partial_hnsw_dda.sql); the exact search always sorts
+        print(f"  Query plan:")
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + search_sql, (embedding_str, top_k))
+        for (line,) in cur.fetchall():
+            print(f"    {line}")
     
-    results = []
-    for row in cur.fetchall():
-        results.append({
-            'source_type': row[0],
-            'component': row[1],
-            'source_name': row[2],
-            'content': row[3],
-            'metadata': row[4],
-            'event_date': str(row[5]) if row[5] else None,
-            'similarity': float(row[6]) if row[6] else None
-        })
+    print(f"  Searching vector database ({'exact' if exact else 'HNSW'})...")
+    cur.execute(search_sql, (embedding_str, top_k))
+    
+    results = [
+        Document(source_type, component, source_name, content, metadata,
+                 None if event_date is None else event_date.isoformat(),
+                 None if distance is None else 1.0 - distance)
+        for source_type, component, source_name, content, metadata, event_date, distance in cur
+    ]
     
     cur.close()
     conn.close()
@@ -71,11 +178,16 @@ def retrieve_context(query: str, top_k: int = 6) -> list:
 
 def main():
     """Test RAG retrieval only"""
-    if len(sys.argv) < 2:
-        print("Usage: python test_rag_simple.py '<your question>'")
+    args = sys.argv[1:]
+    explain = '--explain' in args
+    if explain:
+        args.remove('--explain')
+    if not args:
+        print("Usage: python test_rag_simple.py [--explain] '<your question>'")
+        print("  --explain  print the vector search query plan (EXPLAIN ANALYZE)")
         sys.exit(1)
     
-    query = sys.argv[1]
+    query = args[0]
     
     print("=" * 80)
     print("RAG Retrieval Test (No LLM Generation)")
@@ -85,30 +197,35 @@ def main():
     
     # Retrieve context
     print("Retrieving relevant documents...")
-    contexts = retrieve_context(query)
-    print(f"✓ Found {len(contexts)} relevant documents\n")
+    contexts = retrieve_context(query, explain=explain)
+    print(f"✓ Found {len(contexts)} relevant documents")
+    unique = dedup_contexts(contexts)
+    if len(unique) < len(contexts):
+        print(f"  Removed {len(contexts) - len(unique)} duplicate documents")
+    contexts = unique
+    print()
     
     # Show retrieved documents
     print("=" * 80)
     print("Retrieved Documents (sorted by relevance):")
     print("=" * 80)
     for i, ctx in enumerate(contexts, 1):
-        print(f"\n[{i}] {ctx['source_type']} - {ctx['component']}")
-        if ctx.get('similarity'):
-            print(f"    Similarity: {ctx['similarity']:.3f} ({ctx['similarity']*100:.1f}% match)")
-        if ctx.get('event_date'):
-            print(f"    Date: {ctx['event_date']}")
-        print(f"    Content: {ctx['content']}")
-        if ctx.get('metadata'):
-            print(f"    Metadata: {json.dumps(ctx['metadata'], indent=6)}")
+        print(f"\n[{i}] {ctx.source_type} - {ctx.component}")
+        if ctx.similarity:
+            print(f"    Similarity: {ctx.similarity:.3f} ({ctx.similarity*100:.1f}% match)")
+        if ctx.event_date:
+            print(f"    Date: {ctx.event_date}")
+        print(f"    Content: {ctx.content}")
+        if ctx.metadata:
+            print(f"    Metadata: {format_json(ctx.metadata, indent=6)}")
     
     # Show what would be sent to LLM
     print("\n" + "=" * 80)
     print("Context that would be sent to LLM:")
     print("=" * 80)
-    context_text = "\n\n".join([f"[{ctx['source_type']} - {ctx['component']}]\n{ctx['content']}" for ctx in contexts])
+    context_text, ctx_len = build_context_text(contexts)
     print(context_text)
-    print(f"\nTotal context length: {len(context_text)} characters")
+    print(f"\nTotal context length: {ctx_len} characters")
     print(f"\nTo generate answer, this context would be sent to Phi-4 API")
     print(f"Note: CPU inference may take 2-5 minutes for this query")
 
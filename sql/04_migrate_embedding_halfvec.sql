@@ -0,0 +1,25 @@
+-- Migrate rag_documents.embedding from vector(384) to halfvec(384)
+-- halfvec stores fp16 components: 768 bytes/row instead of 1536, which halves
+-- table and HNSW index size with minimal recall loss for cosine search.
+-- Requires pgvector >= 0.7.0 (halfvec type and halfvec_cosine_ops).
+--
+-- After migrating, load documents and run the query scripts with
+-- EMBEDDING_TYPE=halfvec so embeddings are formatted and cast as halfvec:
+--   EMBEDDING_TYPE=halfvec python3 scripts/load_canonical_documents.py
+--   EMBEDDING_TYPE=halfvec python3 scripts/test_rag_query.py '<your question>'
+
+-- 1) Drop the fp32 vector index (it cannot be converted in place)
+DROP INDEX IF EXISTS idx_rag_embedding_hnsw;
+DROP INDEX IF EXISTS idx_rag_embedding_ivf;
+
+-- 2) Convert stored embeddings to fp16
+ALTER TABLE rag_documents
+  ALTER COLUMN embedding TYPE halfvec(384) USING embedding::halfvec(384);
+
+-- 3) Rebuild the HNSW index on the halfvec column
+CREATE INDEX IF NOT EXISTS idx_rag_embedding_hnsw
+  ON rag_documents USING hnsw (embedding halfvec_cosine_ops)
+  WITH (m = 16, ef_construction = 64);
+
+-- Success message
+SELECT 'Embedding column migrated to halfvec(384) with HNSW index!' as status;
@@ -0,0 +1,31 @@
+-- Partial HNSW index for dda_transactions retrieval
+-- The query scripts search with
+--   WHERE table_name = 'dda_transactions' ORDER BY embedding <=> ... LIMIT k
+-- Against the full-table HNSW index the table_name filter is applied after
+-- the index scan, so the planner often prefers a sequential scan + top-N sort,
+-- and the filter can leave fewer than k rows. A partial index whose predicate
+-- matches the WHERE clause exactly contains only dda_transactions rows, so the
+-- index scan needs no filter and stays the cheapest plan.
+--
+-- The full-table index (idx_rag_embedding_hnsw) is kept for the backend's
+-- unfiltered searches. If the column was migrated to halfvec
+-- (04_migrate_embedding_halfvec.sql), use halfvec_cosine_ops instead.
+--
+-- Verify the plan uses the new index:
+--   BRUTE_FORCE_THRESHOLD=0 python3 scripts/test_rag_simple.py --explain '<your question>'
+-- should show "Index Scan using idx_rag_embedding_hnsw_dda", not "Seq Scan".
+-- BRUTE_FORCE_THRESHOLD=0 forces the HNSW search: by default, fewer than 2000
+-- dda_transactions rows (e.g. the 12 canonical documents) are searched exactly
+-- with a scan + sort, and this index is not used.
+
+-- 1) HNSW index over dda_transactions rows only
+CREATE INDEX IF NOT EXISTS idx_rag_embedding_hnsw_dda
+  ON rag_documents USING hnsw (embedding vector_cosine_ops)
+  WITH (m = 16, ef_construction = 64)
+  WHERE table_name = 'dda_transactions';
+
+-- 2) Refresh planner statistics so the new index is costed correctly
+ANALYZE rag_documents;
+
+-- Success message
+SELECT 'Partial HNSW index for dda_transactions created successfully!' as status;
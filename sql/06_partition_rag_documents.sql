@@ -0,0 +1,70 @@
+-- Partition rag_documents by table_name
+-- Every query script search is scoped to one Cassandra table
+-- (WHERE table_name = 'dda_transactions'). On a single table the HNSW index
+-- also covers every other table's rows, and the filter is applied during or
+-- after the index scan. Splitting the table with LIST partitioning by
+-- table_name gives dda_transactions its own partition: its HNSW index holds
+-- only those rows, needs no filter, and can be tuned on its own.
+--
+-- The partitioned table keeps the name rag_documents, so the backend and
+-- loaders still read and write it. REBUILD_VECTOR_INDEX=1 in
+-- load_canonical_documents.py drops and rebuilds the partition HNSW indexes
+-- below with their own parameters. The old table is kept as rag_documents_unpartitioned
+-- until you drop it. The partial index from 05_create_partial_hnsw_dda.sql is
+-- not carried over; the dda_transactions partition index replaces it. If the
+-- column was migrated to halfvec (04_migrate_embedding_halfvec.sql), use
+-- halfvec_cosine_ops instead.
+--
+-- Query the partition directly (no table_name filter; the scripts accept only
+-- the table names listed in SEARCH_FILTERS in scripts/rag_common.py):
+--   RAG_TABLE=rag_documents_dda python3 scripts/test_rag_query.py '<your question>'
+--   RAG_TABLE=rag_documents_dda python3 scripts/test_rag_simple.py --explain '<your question>'
+
+BEGIN;
+
+-- 1) Partitioned copy of the table definition (columns, NOT NULLs, defaults)
+CREATE TABLE rag_documents_partitioned (LIKE rag_documents INCLUDING DEFAULTS)
+  PARTITION BY LIST (table_name);
+
+-- 2) One partition for dda_transactions; all other tables (and NULL) go to the default
+CREATE TABLE rag_documents_dda PARTITION OF rag_documents_partitioned
+  FOR VALUES IN ('dda_transactions');
+CREATE TABLE rag_documents_other PARTITION OF rag_documents_partitioned DEFAULT;
+
+-- 3) Copy the documents
+INSERT INTO rag_documents_partitioned SELECT * FROM rag_documents;
+
+-- 4) Primary keys per partition (a key on the parent would have to include table_name)
+ALTER TABLE rag_documents_dda ADD PRIMARY KEY (id);
+ALTER TABLE rag_documents_other ADD PRIMARY KEY (id);
+
+-- 5) Vector HNSW indexes, tuned per partition: the searched dda_transactions
+--    partition gets a denser graph for higher recall at the same ef_search
+CREATE INDEX idx_rag_dda_embedding_hnsw
+  ON rag_documents_dda USING hnsw (embedding vector_cosine_ops)
+  WITH (m = 24, ef_construction = 128);
+CREATE INDEX idx_rag_other_embedding_hnsw
+  ON rag_documents_other USING hnsw (embedding vector_cosine_ops)
+  WITH (m = 16, ef_construction = 64);
+
+-- 6) Filtering indexes (created on every partition)
+CREATE INDEX idx_rag_part_cluster ON rag_documents_partitioned(cluster_name);
+CREATE INDEX idx_rag_part_source_type ON rag_documents_partitioned(source_type);
+CREATE INDEX idx_rag_part_doc_sub_type ON rag_documents_partitioned(doc_sub_type);
+CREATE INDEX idx_rag_part_entity_type ON rag_documents_partitioned(entity_type);
+CREATE INDEX idx_rag_part_component ON rag_documents_partitioned(component);
+CREATE INDEX idx_rag_part_event_date ON rag_documents_partitioned(event_date);
+CREATE INDEX idx_rag_part_cluster_keyspace_table ON rag_documents_partitioned(cluster_name, keyspace, table_name);
+CREATE INDEX idx_rag_part_keyspace_table ON rag_documents_partitioned(keyspace, table_name);
+
+-- 7) Swap the partitioned table in under the original name
+ALTER TABLE rag_documents RENAME TO rag_documents_unpartitioned;
+ALTER TABLE rag_documents_partitioned RENAME TO rag_documents;
+
+COMMIT;
+
+-- 8) Refresh planner statistics for the new partitions
+ANALYZE rag_documents;
+
+-- Success message
+SELECT 'rag_documents partitioned by table_name (rag_documents_dda + rag_documents_other)!' as status;